@@ -1,28 +1,65 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from contextlib import asynccontextmanager
 import os
-from app.database import Database
 
-# Инициализируем базу данных как синглтон
-db = Database()
+from app import config  # noqa: F401 - загружает .env до чтения настроек модулями
 
-app = FastAPI(title="API Network Monitor", description="Мониторинг сетевых устройств")
+# Каталог статических файлов относительно рабочего каталога
+STATIC_DIR = "static"
+# Ответы меньше этого размера в байтах не сжимаются
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1000"))
 
-# Проверяем существование директории static и создаем её при необходимости
-if not os.path.exists("static"):
-    os.makedirs("static")
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="app/templates")
+@asynccontextmanager
+async def lifespan(app):
+    """Запуск и остановка монитора вместе с приложением.
 
-# Обработчики событий для корректного закрытия соединения с БД
-@app.on_event("shutdown")
-async def shutdown_db_client():
+    Реестр устройств, движок проверок и схема БД инициализируются здесь,
+    а не при импорте пакета, поэтому импорт быстрый и не трогает БД.
+    """
+    from app.database import db, history, status_writer
+    from app.services.events import event_pipeline
+    from app.services.monitor import device_monitor
+
+    # Некорректные получатели событий - ошибка запуска, а не каждого перехода
+    event_pipeline.load_sinks()
+    device_monitor.start()
+    # Возобновляем мониторинг, который шел до перезапуска
+    device_monitor.resume_monitoring()
+    yield
+    # Корректное закрытие проверок, очередей записи и соединений с БД
+    device_monitor.shutdown()
+    event_pipeline.close()
+    status_writer.close()
+    history.close()
     db.close()
 
-# Импортируем маршруты
-from app.routes import device_routes
 
-# Регистрируем маршруты
-app.include_router(device_routes.router)
\ No newline at end of file
+def create_app():
+    """Создает приложение FastAPI с маршрутами и статикой"""
+    from fastapi import FastAPI
+    from fastapi.middleware.gzip import GZipMiddleware
+    from fastapi.staticfiles import StaticFiles
+    from app.routes import device_routes, api_routes
+
+    application = FastAPI(title="API Network Monitor", description="Мониторинг сетевых устройств",
+                          lifespan=lifespan)
+    # Сжатие ответов: страница со списком устройств и JSON хорошо сжимаются
+    application.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
+
+    # Проверяем существование директории static и создаем её при необходимости
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    application.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+
+    # Регистрируем маршруты
+    application.include_router(device_routes.router)
+    application.include_router(api_routes.router)
+    return application
+
+
+def __getattr__(name):
+    # Совместимость с "from app import app" и "uvicorn app:app": приложение
+    # создается при первом обращении, а не при импорте пакета
+    if name == "app":
+        application = globals()["app"] = create_app()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,5 @@
+from dotenv import load_dotenv
+
+# Файл .env читается один раз, при импорте пакета app, до того как модули
+# прочитают свои настройки; переменные окружения процесса важнее файла
+load_dotenv()
@@ -1,140 +1,807 @@
 import os
+import queue
 import sqlite3
+import threading
+import time
+from collections import defaultdict
 from contextlib import contextmanager
-from dotenv import load_dotenv
 
-# Загрузка переменных окружения
-load_dotenv()
+from app.services.metrics import DB_FLUSH_DURATION, DB_FLUSH_ROWS
 
 # Получение пути к базе данных из переменных окружения
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///devices.db")
 DB_PATH = DATABASE_URL.replace("sqlite:///", "")
 
+# Параметры соединений SQLite
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+DB_READ_WAIT = float(os.getenv("DB_READ_WAIT", "1"))  # секунды ожидания свободного соединения пула
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))  # миллисекунды
+DB_LOCK_RETRIES = int(os.getenv("DB_LOCK_RETRIES", "3"))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+
+# Настройки хранения истории проверок
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "500"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1"))
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "7"))
+ROLLUP_1M_RETENTION_DAYS = int(os.getenv("ROLLUP_1M_RETENTION_DAYS", "30"))
+ROLLUP_1H_RETENTION_DAYS = int(os.getenv("ROLLUP_1H_RETENTION_DAYS", "365"))
+# Сколько строк удаляется за одну транзакцию при очистке по срокам хранения
+RETENTION_CHUNK = int(os.getenv("RETENTION_CHUNK", "5000"))
+# Пауза между транзакциями очистки, чтобы запись статусов и истории не ждала
+RETENTION_PAUSE = 0.01
+
+# Настройки отложенной записи статусов устройств
+STATUS_BATCH_SIZE = int(os.getenv("STATUS_BATCH_SIZE", "1000"))
+STATUS_FLUSH_INTERVAL = float(os.getenv("STATUS_FLUSH_INTERVAL", "0.5"))
+
+# Версия схемы в PRAGMA user_version; увеличивается при каждом изменении DDL
+SCHEMA_VERSION = 1
+
+# Разрешения агрегатов истории в секундах
+ROLLUP_RESOLUTIONS = (60, 3600)
+# Число устройств в одном запросе истории по набору устройств
+HISTORY_QUERY_CHUNK = 500
+# Интервал, начиная с которого корзины по часам собираются из часовых агрегатов
+HOURLY_SOURCE_RANGE = 2 * 86400
+
 class Database:
+    """Слой доступа к SQLite, безопасный для использования из нескольких потоков.
+
+    Все записи идут через одно соединение-писатель под блокировкой (SQLite
+    допускает только одного писателя), чтение - через пул отдельных
+    соединений. В режиме WAL чтение не блокирует запись и наоборот.
+    Файл БД открывается и схема проверяется при первом запросе, а не при
+    создании объекта.
+    """
+
     _instance = None
     
     def __new__(cls, db_path=DB_PATH):
         if cls._instance is None:
             cls._instance = super(Database, cls).__new__(cls)
-            cls._instance.db_path = db_path
-            cls._instance.connection = None
-            cls._instance._init_db()
+            cls._instance._setup(db_path)
         return cls._instance
     
     def __init__(self, db_path=DB_PATH):
         # Инициализация уже произошла в __new__
         pass
+
+    def _setup(self, db_path):
+        self.db_path = db_path
+        self._writer = None
+        self._write_lock = threading.RLock()
+        self._readers = queue.LifoQueue()
+        self._readers_lock = threading.Lock()
+        self._reader_count = 0
+        self._schema_ready = False
     
-    def _init_db(self):
-        """Инициализация базы данных и создание таблиц"""
-        with self._get_connection() as conn:
-            conn.execute("""
-            CREATE TABLE IF NOT EXISTS devices (
-                id TEXT PRIMARY KEY,
-                ip TEXT NOT NULL,
-                name TEXT NOT NULL,
-                description TEXT,
-                is_online INTEGER,
-                last_check TEXT
-            )
-            """)
-    
+    def _connect(self, read_only=False):
+        """Открывает соединение с настроенными параметрами SQLite"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT / 1000,
+            check_same_thread=False,
+            # Писатель управляет транзакциями явно через BEGIN IMMEDIATE
+            isolation_level=None,
+            # Кэш подготовленных выражений на соединение
+            cached_statements=DB_STATEMENT_CACHE,
+        )
+        conn.row_factory = sqlite3.Row  # Возвращать результаты как словари
+        conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}")
+        conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+        return conn
+
+    @contextmanager
+    def _writer_connection(self):
+        """Соединение-писатель под блокировкой"""
+        with self._write_lock:
+            if self._writer is None:
+                conn = self._connect()
+                if not self._schema_ready:
+                    try:
+                        self._init_db(conn)
+                    except Exception:
+                        # Соединение не сохраняем, чтобы следующий вызов повторил создание схемы
+                        conn.close()
+                        raise
+                self._writer = conn
+            yield self._writer
+
     @contextmanager
-    def _get_connection(self):
-        """Контекстный менеджер для соединения с базой данных"""
-        # Используем существующее соединение или создаем новое
-        if self.connection is None:
-            self.connection = sqlite3.connect(self.db_path)
-            self.connection.row_factory = sqlite3.Row  # Возвращать результаты как словари
-        
+    def _reader_connection(self):
+        """Соединение из пула чтения.
+
+        При исчерпании пула ждет свободное не дольше DB_READ_WAIT, затем
+        открывает временное соединение сверх пула, которое закрывается
+        после запроса - чтение никогда не блокируется бессрочно.
+        """
+        self._ensure_schema()
+        overflow = False
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._readers_lock:
+                if self._reader_count < DB_READ_POOL_SIZE:
+                    self._reader_count += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect(read_only=True)
+                except Exception:
+                    with self._readers_lock:
+                        self._reader_count -= 1
+                    raise
+            else:
+                try:
+                    conn = self._readers.get(timeout=DB_READ_WAIT)
+                except queue.Empty:
+                    conn = self._connect(read_only=True)
+                    overflow = True
+
+        broken = False
+        try:
+            yield conn
+        except sqlite3.ProgrammingError:
+            # Соединение закрыто или повреждено - заменяем только его
+            broken = True
+            raise
+        finally:
+            if overflow:
+                conn.close()
+            elif broken:
+                with self._readers_lock:
+                    self._reader_count -= 1
+                conn.close()
+            else:
+                self._readers.put(conn)
+
+    def _ensure_schema(self):
+        if not self._schema_ready:
+            with self._writer_connection():
+                pass
+
+    @staticmethod
+    def _retry(operation):
+        """Повторяет операцию, если база занята другим процессом"""
+        for attempt in range(DB_LOCK_RETRIES):
+            try:
+                return operation()
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                if attempt == DB_LOCK_RETRIES - 1:
+                    raise
+                time.sleep(0.05 * 2 ** attempt)
+
+    def _init_db(self, conn):
+        """Создание и обновление таблиц, если версия схемы в БД устарела.
+
+        Версия читается без блокировки, поэтому при готовой схеме запуск
+        не выполняет DDL. Иначе схема обновляется под BEGIN IMMEDIATE с
+        повторной проверкой версии: из нескольких одновременно стартующих
+        процессов DDL выполняет один, остальные дожидаются блокировки и
+        видят готовую схему.
+        """
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            self._schema_ready = True
+            return
+        self._retry(lambda: conn.execute("BEGIN IMMEDIATE"))
         try:
-            yield self.connection
-        except Exception as e:
-            # В случае ошибки закрываем соединение и создаем новое при следующем запросе
-            if self.connection:
-                self.connection.close()
-                self.connection = None
-            raise e
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._create_schema(conn)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        except BaseException:
+            conn.rollback()
+            raise
+        self._retry(conn.commit)
+        self._schema_ready = True
+
+    def _create_schema(self, conn):
+        """Создание таблиц и недостающих колонок"""
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS devices (
+            id TEXT PRIMARY KEY,
+            ip TEXT NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            is_online INTEGER,
+            last_check TEXT
+        )
+        """)
+        self._ensure_columns(conn, "devices", {
+            "tags": "TEXT",
+            "check_interval": "REAL",
+            "monitoring": "INTEGER NOT NULL DEFAULT 0",
+            "next_check": "REAL",
+            "parent_id": "TEXT",
+            "check_type": "TEXT",
+            "check_target": "TEXT",
+        })
+        # Компактный числовой индекс устройства для таблиц истории
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS device_index (
+            idx INTEGER PRIMARY KEY,
+            device_id TEXT NOT NULL UNIQUE
+        )
+        """)
+        # Сырые результаты проверок: время в секундах, код статуса, RTT в микросекундах
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS probe_history (
+            device_idx INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            status INTEGER NOT NULL,
+            rtt_us INTEGER
+        )
+        """)
+        conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_probe_history_device_ts
+        ON probe_history (device_idx, ts)
+        """)
+        conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_probe_history_ts ON probe_history (ts)
+        """)
+        # Агрегаты по минутам и часам
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS probe_rollup (
+            device_idx INTEGER NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            up INTEGER NOT NULL,
+            rtt_count INTEGER NOT NULL,
+            rtt_sum INTEGER NOT NULL,
+            rtt_min INTEGER,
+            rtt_max INTEGER,
+            PRIMARY KEY (device_idx, resolution, bucket)
+        ) WITHOUT ROWID
+        """)
+    
+    @staticmethod
+    def _ensure_columns(conn, table, columns):
+        """Добавляет в существующую таблицу недостающие колонки"""
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, definition in columns.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    @contextmanager
+    def transaction(self):
+        """Выполняет несколько запросов в одной транзакции записи"""
+        with self._writer_connection() as conn:
+            self._retry(lambda: conn.execute("BEGIN IMMEDIATE"))
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            self._retry(conn.commit)
     
     def execute(self, query, params=None):
         """Выполнение SQL запроса (не возвращает курсор вне контекста)"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            conn.commit()
+        with self.transaction() as conn:
+            cursor = conn.execute(query, params or ())
             # Возвращаем число затронутых строк для справки
             return cursor.rowcount
+
+    def execute_many(self, query, seq_of_params):
+        """Выполнение запроса для набора параметров в одной транзакции"""
+        with self.transaction() as conn:
+            return conn.executemany(query, seq_of_params).rowcount
     
     def fetch_all(self, query, params=None):
         """Получение всех результатов запроса"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            rows = cursor.fetchall()
+        with self._reader_connection() as conn:
+            rows = conn.execute(query, params or ()).fetchall()
             # Преобразуем результаты в список словарей для безопасного использования вне контекста
-            result = [dict(row) for row in rows]
-            return result
+            return [dict(row) for row in rows]
     
     def fetch_one(self, query, params=None):
         """Получение одного результата запроса"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            row = cursor.fetchone()
+        with self._reader_connection() as conn:
+            row = conn.execute(query, params or ()).fetchone()
             # Преобразуем результат в словарь для безопасного использования вне контекста
             if row:
                 return dict(row)
             return None
+
+    def iterate(self, query, params=None, size=1000):
+        """Построчное чтение результата запроса без загрузки его в память.
+
+        Генератор может жить долго (выгрузка медленному клиенту), поэтому
+        использует собственное соединение вне пула чтения, закрываемое,
+        когда генератор исчерпан или закрыт.
+        """
+        self._ensure_schema()
+        conn = self._connect(read_only=True)
+        try:
+            cursor = conn.execute(query, params or ())
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            conn.close()
     
     def insert(self, table, data):
         """Вставка данных в таблицу"""
         placeholders = ", ".join(["?"] * len(data))
         columns = ", ".join(data.keys())
-        values = tuple(data.values())
-        
         query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, values)
-            conn.commit()
+        self.execute(query, tuple(data.values()))
     
     def update(self, table, data, condition):
         """Обновление данных в таблице"""
         set_clause = ", ".join([f"{key} = ?" for key in data.keys()])
         where_clause = " AND ".join([f"{key} = ?" for key in condition.keys()])
-        
-        values = tuple(list(data.values()) + list(condition.values()))
         query = f"UPDATE {table} SET {set_clause} WHERE {where_clause}"
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, values)
-            conn.commit()
+        self.execute(query, tuple(list(data.values()) + list(condition.values())))
             
     def close(self):
-        """Закрытие соединения с базой данных"""
-        if self.connection:
-            self.connection.close()
-            self.connection = None
+        """Закрытие всех соединений с базой данных"""
+        with self._write_lock:
+            if self._writer:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._readers_lock:
+            self._reader_count = 0
     
     def delete(self, table, condition):
         """Удаление данных из таблицы"""
         where_clause = " AND ".join([f"{key} = ?" for key in condition.keys()])
-        values = tuple(condition.values())
-        
         query = f"DELETE FROM {table} WHERE {where_clause}"
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, values)
-            conn.commit()
+        self.execute(query, tuple(condition.values()))
+
+
+class BatchWriter:
+    """Базовый класс отложенной пакетной записи в БД.
+
+    Данные копятся в буфере и записываются одной транзакцией в фоновом
+    потоке по таймеру или при заполнении буфера. Ведется статистика
+    размера и длительности сбросов.
+    """
+
+    name = "writer"
+
+    def __init__(self, database, batch_size, flush_interval):
+        self.db = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._metrics = {
+            "flushes": 0,
+            "rows": 0,
+            "last_size": 0,
+            "last_latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+            "total_latency_ms": 0.0,
+            "errors": 0,
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Останавливает фоновую запись и сбрасывает остаток буфера"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _added(self, size):
+        """Вызывается после добавления данных в буфер"""
+        if self._thread is None:
+            self.start()
+        if size >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self._periodic()
+            except Exception as e:
+                self._metrics["errors"] += 1
+                print(f"Ошибка записи ({self.name}): {e}")
+
+    def _periodic(self):
+        """Дополнительные периодические задачи фонового потока"""
+
+    def _take(self):
+        """Забирает накопленные данные из буфера"""
+        raise NotImplementedError
+
+    def _write(self, conn, batch):
+        """Записывает пакет внутри транзакции, возвращает число строк"""
+        raise NotImplementedError
+
+    def pending(self):
+        raise NotImplementedError
+
+    def flush(self):
+        """Записывает накопленные данные одной транзакцией"""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._take()
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            with self.db.transaction() as conn:
+                count = self._write(conn, batch)
+            latency = (time.perf_counter() - started) * 1000
+            DB_FLUSH_DURATION.observe(latency / 1000, self.name)
+            DB_FLUSH_ROWS.inc(self.name, amount=count)
+
+            metrics = self._metrics
+            metrics["flushes"] += 1
+            metrics["rows"] += count
+            metrics["last_size"] = count
+            metrics["last_latency_ms"] = round(latency, 3)
+            metrics["max_latency_ms"] = round(max(metrics["max_latency_ms"], latency), 3)
+            metrics["total_latency_ms"] += latency
+        return count
+
+    def stats(self):
+        metrics = dict(self._metrics)
+        flushes = metrics["flushes"]
+        metrics["avg_size"] = round(metrics["rows"] / flushes, 2) if flushes else 0
+        metrics["avg_latency_ms"] = round(metrics.pop("total_latency_ms") / flushes, 3) if flushes else 0
+        metrics["pending"] = self.pending()
+        return metrics
+
+
+class HistoryStore(BatchWriter):
+    """Хранилище истории проверок с пакетной записью.
+
+    Вместе с сырыми записями при каждом сбросе обновляются агрегаты
+    по минутам и часам.
+    """
+
+    name = "history-writer"
+
+    def __init__(self, database, batch_size=HISTORY_BATCH_SIZE, flush_interval=HISTORY_FLUSH_INTERVAL):
+        super().__init__(database, batch_size, flush_interval)
+        self._buffer = []
+        self._device_idx = {}
+        self._last_retention = 0
+
+    def append(self, device_id, ts, status, rtt_ms=None):
+        """Добавляет результат проверки в буфер записи"""
+        rtt_us = int(rtt_ms * 1000) if rtt_ms is not None else None
+        with self._lock:
+            self._buffer.append((device_id, int(ts), status, rtt_us))
+            size = len(self._buffer)
+        self._added(size)
+
+    def _take(self):
+        batch, self._buffer = self._buffer, []
+        return batch
+
+    def pending(self):
+        return len(self._buffer)
+
+    def _periodic(self):
+        if time.time() - self._last_retention > 3600:
+            self.apply_retention()
+
+    def _get_device_idx(self, conn, device_id):
+        idx = self._device_idx.get(device_id)
+        if idx is None:
+            conn.execute("INSERT OR IGNORE INTO device_index (device_id) VALUES (?)", (device_id,))
+            row = conn.execute("SELECT idx FROM device_index WHERE device_id = ?", (device_id,)).fetchone()
+            idx = self._device_idx[device_id] = row[0]
+        return idx
+
+    def _write(self, conn, batch):
+        rows = [(self._get_device_idx(conn, device_id), ts, status, rtt_us)
+                for device_id, ts, status, rtt_us in batch]
+        conn.executemany(
+            "INSERT INTO probe_history (device_idx, ts, status, rtt_us) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        conn.executemany("""
+            INSERT INTO probe_rollup
+                (device_idx, resolution, bucket, total, up, rtt_count, rtt_sum, rtt_min, rtt_max)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (device_idx, resolution, bucket) DO UPDATE SET
+                total = total + excluded.total,
+                up = up + excluded.up,
+                rtt_count = rtt_count + excluded.rtt_count,
+                rtt_sum = rtt_sum + excluded.rtt_sum,
+                rtt_min = min(coalesce(rtt_min, excluded.rtt_min), coalesce(excluded.rtt_min, rtt_min)),
+                rtt_max = max(coalesce(rtt_max, excluded.rtt_max), coalesce(excluded.rtt_max, rtt_max))
+            """, self._rollup(rows))
+        return len(rows)
+
+    @staticmethod
+    def _rollup(rows):
+        """Агрегирует пакет записей по устройствам и интервалам"""
+        buckets = defaultdict(lambda: [0, 0, 0, 0, None, None])
+        for idx, ts, status, rtt_us in rows:
+            for resolution in ROLLUP_RESOLUTIONS:
+                agg = buckets[(idx, resolution, ts - ts % resolution)]
+                agg[0] += 1
+                agg[1] += 1 if status == 1 else 0
+                if rtt_us is not None:
+                    agg[2] += 1
+                    agg[3] += rtt_us
+                    agg[4] = rtt_us if agg[4] is None else min(agg[4], rtt_us)
+                    agg[5] = rtt_us if agg[5] is None else max(agg[5], rtt_us)
+        return [key + tuple(agg) for key, agg in buckets.items()]
+
+    def apply_retention(self, now=None):
+        """Удаляет записи старше сроков хранения.
+
+        Удаление идет частями по RETENTION_CHUNK строк, каждая в своей
+        транзакции: между частями блокировки записи освобождаются, и
+        сброс статусов, истории и сохранение устройств не ждут всю очистку.
+        Возвращает число удаленных сырых записей.
+        """
+        now = int(now or time.time())
+        self._last_retention = now
+        deleted = 0
+        while True:
+            with self._flush_lock, self.db.transaction() as conn:
+                count = conn.execute(
+                    "DELETE FROM probe_history WHERE rowid IN "
+                    "(SELECT rowid FROM probe_history WHERE ts < ? LIMIT ?)",
+                    (now - HISTORY_RETENTION_DAYS * 86400, RETENTION_CHUNK),
+                ).rowcount
+            deleted += count
+            if count < RETENTION_CHUNK:
+                break
+            time.sleep(RETENTION_PAUSE)
+
+        # Агрегаты удаляются по устройствам: первичный ключ начинается с device_idx
+        indexes = [r["idx"] for r in self.db.fetch_all("SELECT idx FROM device_index")]
+        cutoffs = ((60, now - ROLLUP_1M_RETENTION_DAYS * 86400), (3600, now - ROLLUP_1H_RETENTION_DAYS * 86400))
+        for i in range(0, len(indexes), HISTORY_QUERY_CHUNK):
+            with self._flush_lock, self.db.transaction() as conn:
+                conn.executemany(
+                    "DELETE FROM probe_rollup WHERE device_idx = ? AND resolution = ? AND bucket < ?",
+                    [(idx, resolution, cutoff) for idx in indexes[i:i + HISTORY_QUERY_CHUNK]
+                     for resolution, cutoff in cutoffs],
+                )
+            time.sleep(RETENTION_PAUSE)
+        return deleted
+
+    def query(self, device_id, start, end, resolution=None):
+        """Возвращает историю устройства за интервал [start, end).
+
+        Без resolution возвращаются сырые записи, иначе агрегаты
+        с указанным разрешением (60 или 3600 секунд).
+        """
+        row = self.db.fetch_one("SELECT idx FROM device_index WHERE device_id = ?", (device_id,))
+        if not row:
+            return []
+        if resolution is None:
+            rows = self.db.fetch_all(
+                "SELECT ts, status, rtt_us FROM probe_history "
+                "WHERE device_idx = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (row["idx"], int(start), int(end)),
+            )
+            return [{
+                "ts": r["ts"],
+                "status": r["status"],
+                "rtt": r["rtt_us"] / 1000 if r["rtt_us"] is not None else None,
+            } for r in rows]
+
+        rows = self.db.fetch_all(
+            "SELECT bucket, total, up, rtt_count, rtt_sum, rtt_min, rtt_max FROM probe_rollup "
+            "WHERE device_idx = ? AND resolution = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+            (row["idx"], resolution, int(start) - int(start) % resolution, int(end)),
+        )
+        return [{
+            "ts": r["bucket"],
+            "total": r["total"],
+            "uptime": round(r["up"] * 100 / r["total"], 2),
+            "avg_rtt": round(r["rtt_sum"] / r["rtt_count"] / 1000, 3) if r["rtt_count"] else None,
+            "min_rtt": r["rtt_min"] / 1000 if r["rtt_min"] is not None else None,
+            "max_rtt": r["rtt_max"] / 1000 if r["rtt_max"] is not None else None,
+        } for r in rows]
+
+    def _device_indexes(self, device_ids):
+        """Индексы устройств, у которых есть история: [(idx, device_id)]"""
+        device_ids = list(device_ids)
+        found = []
+        for i in range(0, len(device_ids), HISTORY_QUERY_CHUNK):
+            chunk = device_ids[i:i + HISTORY_QUERY_CHUNK]
+            found.extend((r["idx"], r["device_id"]) for r in self.db.fetch_all(
+                f"SELECT idx, device_id FROM device_index WHERE device_id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ))
+        return sorted(found)
+
+    def _chunks(self, device_ids):
+        """Части набора устройств: (idx -> device_id, плейсхолдеры для IN)"""
+        indexes = self._device_indexes(device_ids)
+        for i in range(0, len(indexes), HISTORY_QUERY_CHUNK):
+            chunk = dict(indexes[i:i + HISTORY_QUERY_CHUNK])
+            yield chunk, ", ".join("?" * len(chunk))
+
+    @staticmethod
+    def source_resolution(start, end, bucket=None, now=None):
+        """Откуда собирать корзины: None - сырые записи, иначе разрешение агрегатов.
+
+        Корзины, не кратные минуте, считаются по сырым записям. Иначе
+        берутся минутные агрегаты, а для длинных интервалов с корзинами
+        по часам (или одной корзиной на весь интервал) и для периодов
+        старше срока хранения минутных - часовые.
+        """
+        if bucket is not None and bucket % 60:
+            return None
+        now = now or time.time()
+        hourly = bucket is None or bucket % 3600 == 0
+        if hourly and (end - start >= HOURLY_SOURCE_RANGE or start < now - ROLLUP_1M_RETENTION_DAYS * 86400):
+            return 3600
+        return 60
+
+    def buckets(self, device_ids, start, end, bucket=None):
+        """Uptime и RTT устройств по корзинам размера bucket за [start, end).
+
+        Без bucket весь интервал - одна корзина (например, для SLA).
+        Корзины выравниваются по bucket от начала эпохи; при сборке из
+        агрегатов границы интервала округляются до их разрешения.
+        Генератор возвращает (device_id, ts, total, up, rtt_count,
+        rtt_sum_ms, rtt_min_ms, rtt_max_ms), упорядоченные по устройству
+        и времени.
+        """
+        resolution = self.source_resolution(start, end, bucket)
+        start = int(start)
+        if bucket is not None:
+            start -= start % bucket
+        if resolution is not None:
+            start -= start % resolution
+        step = bucket or max(1, int(end) - start)
+        if resolution is None:
+            source = ("probe_history", "ts", "count(*), sum(status = 1), count(rtt_us), "
+                      "sum(rtt_us), min(rtt_us), max(rtt_us)", "")
+        else:
+            source = ("probe_rollup", "bucket", "sum(total), sum(up), sum(rtt_count), "
+                      "sum(rtt_sum), min(rtt_min), max(rtt_max)", f"AND resolution = {resolution}")
+        table, ts, columns, condition = source
+
+        for chunk, placeholders in self._chunks(device_ids):
+            rows = self.db.iterate(f"""
+                SELECT device_idx, ? + ({ts} - ?) / ? * ? AS b, {columns}
+                FROM {table}
+                WHERE device_idx IN ({placeholders}) AND {ts} >= ? AND {ts} < ? {condition}
+                GROUP BY device_idx, b
+                ORDER BY device_idx, b
+                """, (start, start, step, step, *chunk, start, int(end)))
+            for idx, b, total, up, rtt_count, rtt_sum, rtt_min, rtt_max in rows:
+                yield (
+                    chunk[idx], b, total, up, rtt_count,
+                    rtt_sum / 1000 if rtt_count else None,
+                    rtt_min / 1000 if rtt_min is not None else None,
+                    rtt_max / 1000 if rtt_max is not None else None,
+                )
+
+    def rows(self, device_ids, start, end):
+        """Сырые записи устройств за [start, end) для выгрузки.
+
+        Генератор возвращает (device_id, ts, status, rtt_ms),
+        упорядоченные по устройству и времени.
+        """
+        for chunk, placeholders in self._chunks(device_ids):
+            rows = self.db.iterate(f"""
+                SELECT device_idx, ts, status, rtt_us FROM probe_history
+                WHERE device_idx IN ({placeholders}) AND ts >= ? AND ts < ?
+                ORDER BY device_idx, ts
+                """, (*chunk, int(start), int(end)))
+            for idx, ts, status, rtt_us in rows:
+                yield chunk[idx], ts, status, rtt_us / 1000 if rtt_us is not None else None
+
+    def recent(self, limit, since):
+        """Последние limit записей каждого устройства не старше since.
+
+        Возвращает (device_id, ts, status, rtt_ms), упорядоченные по
+        устройству и времени - для прогрева статистики при старте. Для
+        каждого устройства читается только хвост индекса (device_idx, ts),
+        так что время не зависит от объема истории за срок хранения.
+        """
+        devices = self.db.fetch_all("SELECT idx, device_id FROM device_index ORDER BY idx")
+        for device in devices:
+            rows = self.db.fetch_all(
+                "SELECT ts, status, rtt_us FROM probe_history "
+                "WHERE device_idx = ? AND ts >= ? ORDER BY ts DESC LIMIT ?",
+                (device["idx"], int(since), limit),
+            )
+            for r in reversed(rows):
+                yield device["device_id"], r["ts"], r["status"], r["rtt_us"] / 1000 if r["rtt_us"] is not None else None
+
+    def delete_device(self, device_id):
+        """Удаляет историю устройства"""
+        with self._lock:
+            self._buffer = [item for item in self._buffer if item[0] != device_id]
+        with self._flush_lock, self.db.transaction() as conn:
+            row = conn.execute("SELECT idx FROM device_index WHERE device_id = ?", (device_id,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM probe_history WHERE device_idx = ?", (row[0],))
+                conn.execute("DELETE FROM probe_rollup WHERE device_idx = ?", (row[0],))
+                conn.execute("DELETE FROM device_index WHERE idx = ?", (row[0],))
+            self._device_idx.pop(device_id, None)
+
+
+class StatusWriter(BatchWriter):
+    """Отложенная запись статусов устройств.
+
+    Обновления от всех проверок объединяются по устройству (в БД попадает
+    только последнее состояние) и записываются одним executemany UPDATE.
+    Строка устройства всегда создается при добавлении, поэтому запись
+    только обновляет существующие строки: запоздавший результат проверки
+    не вернет в таблицу уже удаленное устройство.
+    """
+
+    name = "status-writer"
+
+    def __init__(self, database, batch_size=STATUS_BATCH_SIZE, flush_interval=STATUS_FLUSH_INTERVAL):
+        super().__init__(database, batch_size, flush_interval)
+        self._pending = {}
+
+    def submit(self, row):
+        """Добавляет строку устройства (словарь колонок таблицы devices)"""
+        with self._lock:
+            self._pending[row["id"]] = row
+            size = len(self._pending)
+        self._added(size)
+
+    def discard(self, device_id):
+        """Отменяет незаписанное обновление устройства (например, при удалении)"""
+        with self._flush_lock, self._lock:
+            self._pending.pop(device_id, None)
+
+    def _take(self):
+        batch, self._pending = list(self._pending.values()), {}
+        return batch
+
+    def pending(self):
+        return len(self._pending)
+
+    def _write(self, conn, batch):
+        conn.executemany("""
+            UPDATE devices SET
+                is_online = :is_online,
+                last_check = :last_check,
+                monitoring = :monitoring,
+                next_check = :next_check
+            WHERE id = :id
+            """, batch)
+        return len(batch)
+
 
 # Создание экземпляра базы данных для использования в приложении
-db = Database()
\ No newline at end of file
+db = Database()
+history = HistoryStore(db)
+status_writer = StatusWriter(db)
\ No newline at end of file
@@ -1,16 +1,89 @@
-from collections import deque
-from datetime import datetime
-from app import db
+import os
+import time
+from app.database import db
+from app.models.results import ResultRing, format_time, parse_time
+from app.models.stats import RollingStats
+from app.services.metrics import DEVICE_SAVE_DURATION
+
+# Размер окна для статистики RTT и потерь
+STATS_WINDOW = int(os.getenv("STATS_WINDOW", "100"))
+# Число последних проверок, которые показываются в истории устройства
+RESULTS_SIZE = int(os.getenv("RESULTS_SIZE", "100"))
+
+# Вставка или полное обновление строки устройства
+UPSERT_QUERY = """
+    INSERT INTO devices
+        (id, ip, name, description, is_online, last_check, tags, check_interval, monitoring, next_check, parent_id,
+         check_type, check_target)
+    VALUES
+        (:id, :ip, :name, :description, :is_online, :last_check, :tags, :check_interval,
+         :monitoring, :next_check, :parent_id, :check_type, :check_target)
+    ON CONFLICT (id) DO UPDATE SET
+        ip = excluded.ip,
+        name = excluded.name,
+        description = excluded.description,
+        is_online = excluded.is_online,
+        last_check = excluded.last_check,
+        tags = excluded.tags,
+        check_interval = excluded.check_interval,
+        monitoring = excluded.monitoring,
+        next_check = excluded.next_check,
+        parent_id = excluded.parent_id,
+        check_type = excluded.check_type,
+        check_target = excluded.check_target
+"""
+
+
+def parse_tags(value):
+    """Разбирает теги из строки вида "core, msk;edge" или списка"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.replace(";", ",").split(",")
+    return [tag.strip() for tag in value if tag and tag.strip()]
 
 class Device:
-    def __init__(self, id, ip, name, description="", is_online=None, last_check=None):
+    __slots__ = (
+        "id", "ip", "name", "description", "tags", "check_interval", "monitoring", "next_check",
+        "parent_id", "parent_down", "check_type", "check_target", "results", "stats", "is_online", "checked_at", "version",
+    )
+
+    def __init__(self, id, ip, name, description="", is_online=None, last_check=None, tags=None,
+                 check_interval=None, monitoring=False, next_check=None, parent_id=None,
+                 check_type=None, check_target=None):
         self.id = id
         self.ip = ip
         self.name = name
         self.description = description
-        self.results = deque(maxlen=100)
+        self.tags = parse_tags(tags)
+        # Собственный интервал проверки в секундах (None - по тегам или общий)
+        self.check_interval = check_interval
+        # Флаг мониторинга и время следующей проверки переживают перезапуск
+        self.monitoring = monitoring
+        self.next_check = next_check
+        # Устройство, через которое доступно это (например, коммутатор);
+        # parent_down - один из вышестоящих недоступен, вычисляется монитором
+        self.parent_id = parent_id or None
+        self.parent_down = False
+        # Вид проверки (None - ICMP через PROBER; tcp, http, dns) и ее цель:
+        # порт, URL или проверяемое имя
+        self.check_type = check_type or None
+        self.check_target = check_target or None
+        self.results = ResultRing(RESULTS_SIZE)
+        self.stats = RollingStats(STATS_WINDOW)
         self.is_online = is_online
-        self.last_check = last_check
+        # Время последней проверки хранится как epoch, строка - только для вывода
+        self.checked_at = parse_time(last_check)
+        # Счетчик изменений состояния, используется для ETag
+        self.version = 0
+
+    @property
+    def last_check(self):
+        return format_time(self.checked_at)
+
+    @last_check.setter
+    def last_check(self, value):
+        self.checked_at = parse_time(value)
     
     def to_dict(self):
         return {
@@ -19,7 +92,12 @@ class Device:
             "name": self.name,
             "description": self.description,
             "is_online": self.is_online,
-            "last_check": self.last_check
+            "last_check": self.last_check,
+            "tags": self.tags,
+            "check_interval": self.check_interval,
+            "parent_id": self.parent_id,
+            "check_type": self.check_type,
+            "check_target": self.check_target
         }
     
     @classmethod
@@ -34,7 +112,14 @@ class Device:
             name=row['name'],
             description=row['description'],
             is_online=bool(row['is_online']) if row['is_online'] is not None else None,
-            last_check=row['last_check']
+            last_check=row['last_check'],
+            tags=row['tags'],
+            check_interval=row['check_interval'],
+            monitoring=bool(row['monitoring']),
+            next_check=row['next_check'],
+            parent_id=row['parent_id'],
+            check_type=row['check_type'],
+            check_target=row['check_target']
         )
     
     @classmethod
@@ -46,33 +131,39 @@ class Device:
     @classmethod
     def get_all(cls):
         """Получает все устройства из базы данных"""
-        rows = db.fetch_all("SELECT * FROM devices")
+        rows = db.fetch_all("SELECT * FROM devices ORDER BY rowid")
         return [cls.from_db_row(row) for row in rows]
     
-    def save(self):
-        """Сохраняет устройство в базу данных"""
-        device_data = {
+    def to_db_row(self):
+        """Возвращает значения колонок таблицы devices"""
+        return {
             "id": self.id,
             "ip": self.ip,
             "name": self.name,
             "description": self.description,
             "is_online": 1 if self.is_online else 0 if self.is_online is not None else None,
-            "last_check": self.last_check
+            "last_check": self.last_check,
+            "tags": ",".join(self.tags) or None,
+            "check_interval": self.check_interval,
+            "monitoring": 1 if self.monitoring else 0,
+            "next_check": self.next_check,
+            "parent_id": self.parent_id,
+            "check_type": self.check_type,
+            "check_target": self.check_target
         }
-        
-        # Проверяем, существует ли устройство
-        existing = db.fetch_one("SELECT id FROM devices WHERE id = ?", (self.id,))
-        
-        if existing:
-            # Обновляем существующее устройство
-            db.update("devices", 
-                      {k: v for k, v in device_data.items() if k != 'id'}, 
-                      {"id": self.id})
-        else:
-            # Создаем новое устройство
-            db.insert("devices", device_data)
-        
+    
+    def save(self):
+        """Сохраняет устройство в базу данных одним UPSERT-запросом"""
+        started = time.perf_counter()
+        db.execute(UPSERT_QUERY, self.to_db_row())
+        DEVICE_SAVE_DURATION.observe(time.perf_counter() - started)
         return self
+
+    @classmethod
+    def save_many(cls, devices):
+        """Сохраняет набор устройств одной транзакцией"""
+        db.execute_many(UPSERT_QUERY, [device.to_db_row() for device in devices])
+        return devices
     
     def delete(self):
         """Удаляет устройство из базы данных"""
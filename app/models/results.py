@@ -0,0 +1,84 @@
+import math
+from array import array
+from datetime import datetime
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def format_time(ts):
+    """Время проверки (epoch) в виде строки для API и шаблонов"""
+    return datetime.fromtimestamp(ts).strftime(TIME_FORMAT) if ts is not None else None
+
+
+def parse_time(value):
+    """Обратное преобразование строки времени из БД в epoch"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return datetime.strptime(value, TIME_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+class ResultRing:
+    """Последние результаты проверок устройства в кольцевом буфере.
+
+    Каждая запись - время (epoch), код статуса и RTT в миллисекундах,
+    хранящиеся в трех массивах array вместо словаря со строками на каждую
+    проверку. Массивы растут до size и дальше перезаписываются по кругу;
+    сообщения для API формируются только при чтении.
+    """
+
+    __slots__ = ("size", "times", "codes", "rtts", "head")
+
+    def __init__(self, size=100):
+        self.size = size
+        self.times = array("d")
+        self.codes = array("b")
+        self.rtts = array("f")
+        # Позиция самой старой записи после заполнения буфера
+        self.head = 0
+
+    def append(self, ts, code, rtt=None):
+        rtt = math.nan if rtt is None else rtt
+        if len(self.times) < self.size:
+            self.times.append(ts)
+            self.codes.append(code)
+            self.rtts.append(rtt)
+            return
+        head = self.head
+        self.times[head] = ts
+        self.codes[head] = code
+        self.rtts[head] = rtt
+        self.head = (head + 1) % self.size
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        """Записи (ts, код статуса, rtt) от старых к новым"""
+        count = len(self.times)
+        for offset in range(count):
+            index = (self.head + offset) % count
+            rtt = self.rtts[index]
+            yield self.times[index], self.codes[index], None if math.isnan(rtt) else round(rtt, 3)
+
+    def render(self, ip, limit=None):
+        """Записи в прежнем формате API: время, статус, RTT и текст сообщения.
+
+        limit - сколько последних записей вернуть.
+        """
+        records = list(self)
+        if limit:
+            records = records[-limit:]
+        rendered = []
+        for ts, code, rtt in records:
+            current_time = format_time(ts)
+            if code == 1:
+                status = "ДОСТУПЕН"
+                message = f"[{current_time}] ✅ Устройство {ip} ДОСТУПНО"
+            else:
+                status = "НЕДОСТУПЕН"
+                message = f"[{current_time}] ⚠️ Устройство {ip} НЕДОСТУПНО"
+            rendered.append({"time": current_time, "status": status, "rtt": rtt, "message": message})
+        return rendered
@@ -0,0 +1,109 @@
+import math
+from array import array
+
+
+class RollingStats:
+    """Статистика по последним проверкам устройства в скользящем окне.
+
+    Окно - кольцевые буферы array на window проверок: флаг потери и RTT
+    (NaN - RTT неизвестен), без отдельного объекта float на каждую
+    проверку. Потеря определяется только по флагу: успешная проверка без
+    RTT (например, нераспознанный вывод ping) потерей не считается. Сумма
+    RTT и число потерь корректируются на вытесняемый элемент при
+    добавлении, а min/max/p95 считаются при чтении по копии окна.
+    """
+
+    __slots__ = (
+        "window", "losses", "rtts", "head", "rtt_sum", "lost", "jitter", "last_rtt", "last_ttl", "last_error",
+    )
+
+    def __init__(self, window=100):
+        self.window = window
+        self.losses = array("b")
+        self.rtts = array("f")
+        # Позиция самого старого значения после заполнения окна
+        self.head = 0
+        self.rtt_sum = 0.0
+        self.lost = 0
+        self.jitter = None
+        self.last_rtt = None
+        self.last_ttl = None
+        self.last_error = None
+
+    def __len__(self):
+        return len(self.rtts)
+
+    def add(self, result):
+        """Добавляет результат проверки (ProbeResult) в окно"""
+        lost = not result.ok
+        rtt = None if lost else result.rtt
+        value = math.nan if rtt is None else rtt
+
+        rtts = self.rtts
+        if len(rtts) < self.window:
+            position = len(rtts)
+            self.losses.append(lost)
+            rtts.append(value)
+        else:
+            position = self.head
+            self._evict(self.losses[position], rtts[position])
+            self.losses[position] = lost
+            rtts[position] = value
+            self.head = (position + 1) % self.window
+
+        if lost:
+            self.lost += 1
+        if rtt is not None:
+            # В сумму идет сохраненное значение, чтобы вытеснение вычитало то же самое
+            self.rtt_sum += rtts[position]
+            # Сглаженный джиттер по RFC 3550
+            if self.last_rtt is not None:
+                delta = abs(rtt - self.last_rtt)
+                self.jitter = delta if self.jitter is None else self.jitter + (delta - self.jitter) / 16
+            self.last_rtt = rtt
+
+        self.last_ttl = result.ttl if result.ok else self.last_ttl
+        self.last_error = result.error
+
+    def _evict(self, lost, rtt):
+        if lost:
+            self.lost -= 1
+        if not math.isnan(rtt):
+            self.rtt_sum -= rtt
+
+    @property
+    def last_lost(self):
+        """Последняя проверка в окне - потеря"""
+        if not self.losses:
+            return False
+        return bool(self.losses[self.head - 1 if len(self.losses) == self.window else -1])
+
+    def _sorted_rtts(self):
+        return sorted(rtt for rtt in self.rtts if not math.isnan(rtt))
+
+    @staticmethod
+    def _percentile(sorted_rtts, p):
+        if not sorted_rtts:
+            return None
+        index = max(0, -(-len(sorted_rtts) * p // 100) - 1)
+        return round(sorted_rtts[int(index)], 3)
+
+    def percentile(self, p):
+        return self._percentile(self._sorted_rtts(), p)
+
+    def to_dict(self):
+        count = len(self.rtts)
+        sorted_rtts = self._sorted_rtts()
+        received = len(sorted_rtts)
+        return {
+            "count": count,
+            "loss": round(self.lost * 100 / count, 2) if count else None,
+            "min": round(sorted_rtts[0], 3) if received else None,
+            "avg": round(self.rtt_sum / received, 3) if received else None,
+            "max": round(sorted_rtts[-1], 3) if received else None,
+            "p95": self._percentile(sorted_rtts, 95),
+            "jitter": round(self.jitter, 3) if self.jitter is not None else None,
+            "last_rtt": self.last_rtt,
+            "last_ttl": self.last_ttl,
+            "last_error": self.last_error,
+        }
@@ -1 +1,56 @@
-# Инициализация пакета маршрутов
\ No newline at end of file
+# Инициализация пакета маршрутов
+import hashlib
+import os
+import uuid
+from functools import lru_cache
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+# Метка запуска процесса: версии устройств начинаются заново после
+# перезапуска, поэтому ETag прежнего процесса не должен совпасть
+BOOT_ID = uuid.uuid4().hex
+
+
+@lru_cache(maxsize=None)
+def get_templates():
+    """Общий экземпляр шаблонов, создается при первой отрисовке страницы"""
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory=TEMPLATES_DIR)
+
+
+def device_etag(devices, extra):
+    """Слабый ETag по версиям устройств на странице и параметрам выборки"""
+    digest = hashlib.blake2b(f"{BOOT_ID}|{extra}".encode(), digest_size=16)
+    for device in devices:
+        digest.update(f"{device.id}:{device.version};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(request, etag):
+    return etag in request.headers.get("if-none-match", "")
+
+
+class FragmentCache:
+    """Отрисованные фрагменты HTML по устройствам.
+
+    Фрагмент хранится вместе с версией устройства (Device.version растет
+    при каждом изменении состояния) и перерисовывается, только когда
+    версия изменилась. Записи удаленных устройств вычищаются, когда кэш
+    становится заметно больше реестра.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        # device_id -> (версия, фрагмент)
+        self._fragments = {}
+
+    def render(self, device, registry_size, **context):
+        cached = self._fragments.get(device.id)
+        if cached is not None and cached[0] == device.version:
+            return cached[1]
+        from markupsafe import Markup
+        fragment = Markup(get_templates().get_template(self.template).render(device=device, **context))
+        if len(self._fragments) > 2 * registry_size + 100:
+            self._fragments.clear()
+        self._fragments[device.id] = (device.version, fragment)
+        return fragment
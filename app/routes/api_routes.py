@@ -0,0 +1,352 @@
+from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import codecs
+import csv
+import io
+import json
+import time
+import uuid
+
+from app.services.monitor import device_monitor
+from app.models.device import Device
+from app.models.results import format_time
+from app.services.checks import validate_check
+from app.services.policy import validate_interval
+from app.routes import device_etag, etag_matches
+from app.services.prober import result_from_status
+from app.database import history
+
+router = APIRouter(prefix="/api")
+
+# Максимальное число устройств в одном импорте
+IMPORT_LIMIT = 50000
+CHUNK_SIZE = 64 * 1024
+# Максимальное число корзин на устройство в ответе /history
+HISTORY_MAX_BUCKETS = 10000
+
+async def _iter_chunks(request):
+    """Возвращает куски тела запроса или загруженного файла"""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Файл не передан")
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield upload.filename or "", chunk
+    else:
+        async for chunk in request.stream():
+            yield "", chunk
+
+async def _iter_lines(chunks):
+    """Построчно декодирует поток байтов, не загружая его целиком"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    async for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def _make_device(number, item, errors):
+    ip = (item.get("ip") or "").strip()
+    name = (item.get("name") or "").strip()
+    if not ip or not name:
+        errors.append({"line": number, "error": "Не указаны ip или name"})
+        return None
+    try:
+        check_interval = validate_interval(item.get("check_interval"))
+    except ValueError as e:
+        errors.append({"line": number, "error": str(e)})
+        return None
+    parent_id = (item.get("parent_id") or "").strip() or None
+    if parent_id and not device_monitor.get_device(parent_id):
+        errors.append({"line": number, "error": "Родительское устройство не найдено"})
+        return None
+    try:
+        check_type, check_target = validate_check(item.get("check_type"), item.get("check_target"))
+    except ValueError as e:
+        errors.append({"line": number, "error": str(e)})
+        return None
+    return Device(
+        id=str(uuid.uuid4()),
+        ip=ip,
+        name=name,
+        description=(item.get("description") or "").strip(),
+        tags=item.get("tags"),
+        check_interval=check_interval,
+        parent_id=parent_id,
+        check_type=check_type,
+        check_target=check_target,
+    )
+
+@router.post("/devices/import")
+async def import_devices(request: Request):
+    """Массовый импорт устройств из CSV, NDJSON или JSON-массива.
+
+    CSV и NDJSON разбираются построчно по мере чтения тела запроса,
+    все устройства сохраняются одной транзакцией.
+    """
+    content_type = request.headers.get("content-type", "")
+    chunks = _iter_chunks(request)
+    devices, errors = [], []
+
+    if content_type.startswith("application/json"):
+        body = b"".join([chunk async for _, chunk in chunks])
+        try:
+            items = json.loads(body or b"[]")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Некорректный JSON")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Ожидается массив устройств")
+        if len(items) > IMPORT_LIMIT:
+            raise HTTPException(status_code=413, detail=f"Не более {IMPORT_LIMIT} устройств за один импорт")
+        for number, item in enumerate(items, 1):
+            device = _make_device(number, item if isinstance(item, dict) else {}, errors)
+            if device:
+                devices.append(device)
+    else:
+        filename = ""
+
+        async def raw_chunks():
+            nonlocal filename
+            async for name, chunk in chunks:
+                filename = name
+                yield chunk
+
+        is_ndjson = "ndjson" in content_type
+        header = None
+        number = 0
+        async for line in _iter_lines(raw_chunks()):
+            number += 1
+            if not line.strip():
+                continue
+            if is_ndjson or filename.endswith((".ndjson", ".jsonl")):
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    errors.append({"line": number, "error": "Некорректный JSON"})
+                    continue
+            else:
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [value.strip().lower() for value in values]
+                    continue
+                item = dict(zip(header, values))
+            device = _make_device(number, item if isinstance(item, dict) else {}, errors)
+            if device:
+                devices.append(device)
+            if len(devices) > IMPORT_LIMIT:
+                raise HTTPException(status_code=413, detail=f"Не более {IMPORT_LIMIT} устройств за один импорт")
+
+    if devices:
+        device_monitor.add_devices(devices)
+    return {"imported": len(devices), "errors": errors}
+
+@router.get("/status")
+async def devices_status(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    status: str = Query(None, pattern="^(online|offline|unknown)$"),
+    tag: str = None,
+    q: str = None,
+    monitoring: bool = None
+):
+    """Текущее состояние всех устройств одним ответом с пагинацией и фильтрами"""
+    matched = list(device_monitor.filter_devices(status=status, tag=tag, query=q, monitoring=monitoring))
+    page = matched[offset:offset + limit]
+
+    etag = device_etag(page, f"{request.url.query}|{len(matched)}")
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return JSONResponse({
+        "total": len(matched),
+        "offset": offset,
+        "limit": limit,
+        "devices": [
+            dict(device_monitor.device_state(device), tags=device.tags, stats=device.stats.to_dict())
+            for device in page
+        ]
+    }, headers={"ETag": etag})
+
+async def _selection(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный JSON")
+    if not isinstance(body, dict) or not (body.get("ids") or body.get("tag")):
+        raise HTTPException(status_code=400, detail="Укажите ids и/или tag")
+    return device_monitor.select_devices(ids=body.get("ids"), tag=body.get("tag"))
+
+@router.post("/monitoring/start")
+async def bulk_start_monitoring(request: Request):
+    """Запуск мониторинга для списка устройств и/или устройств с тегом"""
+    device_ids = await _selection(request)
+    for device_id in device_ids:
+        device_monitor.start_monitoring(device_id)
+    return {"started": len(device_ids)}
+
+@router.post("/monitoring/stop")
+async def bulk_stop_monitoring(request: Request):
+    """Остановка мониторинга для списка устройств и/или устройств с тегом"""
+    device_ids = await _selection(request)
+    for device_id in device_ids:
+        device_monitor.stop_monitoring(device_id)
+    return {"stopped": len(device_ids)}
+
+def _history_query(ids, tag, start, end, bucket):
+    """Разбирает параметры запроса истории: (ID устройств, start, end)"""
+    end = end or int(time.time())
+    start = start if start is not None else end - 86400
+    if start >= end:
+        raise HTTPException(status_code=400, detail="Начало интервала должно быть раньше конца")
+    if bucket is not None and (end - start) // bucket > HISTORY_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Не более {HISTORY_MAX_BUCKETS} корзин на устройство")
+    if ids or tag:
+        device_ids = device_monitor.select_devices(ids=ids.split(",") if ids else None, tag=tag)
+    else:
+        device_ids = list(device_monitor.devices)
+    return device_ids, start, end
+
+def _uptime(total, up, rtt_count, rtt_sum):
+    """Число проверок, доля успешных в процентах и средний RTT"""
+    return {
+        "total": total,
+        "up": up,
+        "uptime": round(up * 100 / total, 3) if total else None,
+        "avg_rtt": round(rtt_sum / rtt_count, 3) if rtt_count else None,
+    }
+
+@router.get("/history")
+def history_summary(
+    ids: str = None,
+    tag: str = None,
+    start: int = None,
+    end: int = None,
+    bucket: int = Query(None, ge=1)
+):
+    """Uptime и средний RTT набора устройств за интервал и по корзинам.
+
+    Устройства задаются списком ids через запятую и/или тегом (без них -
+    все). Без bucket для каждого устройства возвращается только итог за
+    интервал, по умолчанию - за последние сутки. Обработчик синхронный:
+    FastAPI выполняет его в пуле потоков, и чтение БД не блокирует цикл
+    событий.
+    """
+    device_ids, start, end = _history_query(ids, tag, start, end, bucket)
+    devices = []
+    current = None
+    for device_id, ts, total, up, rtt_count, rtt_sum, rtt_min, rtt_max in history.buckets(
+            device_ids, start, end, bucket):
+        if current is None or current["device_id"] != device_id:
+            device = device_monitor.get_device(device_id)
+            current = {
+                "device_id": device_id,
+                "name": device.name if device else None,
+                "ip": device.ip if device else None,
+                "totals": [0, 0, 0, 0.0],
+                "buckets": [],
+            }
+            devices.append(current)
+        totals = current["totals"]
+        totals[0] += total
+        totals[1] += up
+        totals[2] += rtt_count
+        totals[3] += rtt_sum or 0.0
+        if bucket is not None:
+            current["buckets"].append(dict(
+                _uptime(total, up, rtt_count, rtt_sum),
+                ts=ts, time=format_time(ts), min_rtt=rtt_min, max_rtt=rtt_max,
+            ))
+
+    for item in devices:
+        item.update(_uptime(*item.pop("totals")))
+        if bucket is None:
+            del item["buckets"]
+    return {
+        "start": start,
+        "end": end,
+        "bucket": bucket,
+        "source": history.source_resolution(start, end, bucket) or "raw",
+        "devices": devices,
+    }
+
+def _export_rows(device_ids, start, end, bucket):
+    """Строки выгрузки: заголовок, затем записи по мере чтения из БД"""
+    names = {}
+
+    def name(device_id):
+        if device_id not in names:
+            device = device_monitor.get_device(device_id)
+            names[device_id] = device.name if device else ""
+        return names[device_id]
+
+    if bucket is None:
+        yield ("device_id", "name", "ts", "time", "result", "rtt")
+        for device_id, ts, status, rtt in history.rows(device_ids, start, end):
+            result = result_from_status(status)
+            yield (device_id, name(device_id), ts, format_time(ts), result.error or "ok", rtt)
+    else:
+        yield ("device_id", "name", "ts", "time", "total", "up", "uptime", "avg_rtt", "min_rtt", "max_rtt")
+        for device_id, ts, total, up, rtt_count, rtt_sum, rtt_min, rtt_max in history.buckets(
+                device_ids, start, end, bucket):
+            item = _uptime(total, up, rtt_count, rtt_sum)
+            yield (device_id, name(device_id), ts, format_time(ts), total, up, item["uptime"],
+                   item["avg_rtt"], rtt_min, rtt_max)
+
+def _export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+def _export_ndjson(rows):
+    header = next(rows)
+    chunk = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(header, row)), ensure_ascii=False) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(chunk).encode()
+            chunk, size = [], 0
+    yield "".join(chunk).encode()
+
+@router.get("/history/export")
+async def history_export(
+    ids: str = None,
+    tag: str = None,
+    start: int = None,
+    end: int = None,
+    bucket: int = Query(None, ge=1),
+    format: str = Query("csv", pattern="^(csv|ndjson)$")
+):
+    """Потоковая выгрузка истории в CSV или NDJSON.
+
+    Без bucket выгружаются сырые проверки, иначе - корзины как в /history.
+    Строки читаются из БД и отправляются частями, не собираясь в памяти.
+    """
+    device_ids, start, end = _history_query(ids, tag, start, end, None)
+    rows = _export_rows(device_ids, start, end, bucket)
+    if format == "csv":
+        body, media_type = _export_csv(rows), "text/csv"
+    else:
+        body, media_type = _export_ndjson(rows), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="history-{start}-{end}.{format}"'
+    })
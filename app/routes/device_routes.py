@@ -1,31 +1,98 @@
-from fastapi import APIRouter, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, Request, Form, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, Response
+from urllib.parse import urlencode
+import asyncio
+import json
+import math
+import os
+import time
 import uuid
 
 from app.services.monitor import device_monitor
+from app.services.hub import status_hub, RESYNC
+from app.services.events import event_pipeline
+from app.database import history, status_writer
 from app.models.device import Device
+from app.routes import get_templates, device_etag, etag_matches, FragmentCache
+from app.services.checks import validate_check
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
+
+# Число устройств на странице дашборда по умолчанию
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "100"))
+# Отрисованные строки таблицы устройств
+device_rows = FragmentCache("_device_row.html")
 
 @router.get("/", response_class=HTMLResponse)
-async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {
+async def read_root(
+    request: Request,
+    page: int = Query(1, ge=1),
+    per_page: int = Query(DASHBOARD_PAGE_SIZE, ge=1, le=1000),
+    status: str = None,
+    tag: str = None,
+    q: str = None
+):
+    # Все данные берутся из реестра монитора в памяти; фильтры и
+    # пагинация применяются на сервере, на страницу попадает только
+    # текущая страница устройств
+    status, tag, q = status or None, tag or None, q or None
+    if status not in (None, "online", "offline", "unknown"):
+        raise HTTPException(status_code=400, detail="Допустимый статус: online, offline или unknown")
+    matched = list(device_monitor.filter_devices(status=status, tag=tag, query=q))
+    pages = max(1, math.ceil(len(matched) / per_page))
+    page = min(page, pages)
+    offset = (page - 1) * per_page
+    devices = matched[offset:offset + per_page]
+    counts = device_monitor.status_counts()
+
+    # Повторная загрузка неизменившейся страницы - 304 без отрисовки
+    etag = device_etag(devices, f"{request.url.query}|{len(matched)}|{sorted(counts.items())}")
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Строки устройств перерисовываются, только когда устройство изменилось
+    rows = [
+        device_rows.render(device, len(device_monitor.devices),
+                           monitoring=device_monitor.monitoring_status.get(device.id, False))
+        for device in devices
+    ]
+    return get_templates().TemplateResponse("index.html", {
         "request": request,
-        "devices": device_monitor.get_all_devices(),
-        "monitoring_status": device_monitor.monitoring_status
-    })
+        "devices": devices,
+        "rows": rows,
+        "offset": offset,
+        "total": len(matched),
+        "device_count": len(device_monitor.devices),
+        "page": page,
+        "pages": pages,
+        "per_page": per_page,
+        "filters": {"status": status, "tag": tag, "q": q},
+        "page_query": urlencode({
+            key: value for key, value in (("status", status), ("tag", tag), ("q", q), ("per_page", per_page))
+            if value
+        }),
+        **counts
+    }, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 @router.post("/add_device")
 async def add_device(
     request: Request,
     ip: str = Form(...),
     name: str = Form(...),
-    description: str = Form("")
+    description: str = Form(""),
+    tags: str = Form(""),
+    parent_id: str = Form(""),
+    check_type: str = Form(""),
+    check_target: str = Form("")
 ):
     device_id = str(uuid.uuid4())
-    new_device = Device(id=device_id, ip=ip, name=name, description=description)
+    try:
+        check_type, check_target = validate_check(check_type, check_target)
+        new_device = Device(id=device_id, ip=ip, name=name, description=description, tags=tags,
+                            check_type=check_type, check_target=check_target)
+        device_monitor.set_parent(new_device, parent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     device_monitor.add_device(new_device)
     return RedirectResponse(url="/", status_code=303)
 
@@ -35,13 +102,34 @@ async def edit_device(
     device_id: str,
     ip: str = Form(...),
     name: str = Form(...),
-    description: str = Form("")
+    description: str = Form(""),
+    tags: str = Form(None),
+    check_interval: float = Form(None),
+    parent_id: str = Form(None),
+    check_type: str = Form(None),
+    check_target: str = Form(None)
 ):
     device = device_monitor.get_device(device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Устройство не найдено")
-    
-    device_monitor.update_device(device_id, ip=ip, name=name, description=description)
+
+    # Пустое поле FastAPI передает как None, то есть "не менять". Если поле
+    # есть в форме, пустое значение убирает теги и родителя, а интервал
+    # возвращает к интервалу по тегам или общему
+    form = await request.form()
+    if tags is None and "tags" in form:
+        tags = ""
+    if parent_id is None and "parent_id" in form:
+        parent_id = ""
+    if check_interval is None and "check_interval" in form:
+        check_interval = 0
+
+    try:
+        device_monitor.update_device(device_id, ip=ip, name=name, description=description, tags=tags,
+                                     check_interval=check_interval, parent_id=parent_id,
+                                     check_type=check_type, check_target=check_target)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return RedirectResponse(url="/", status_code=303)
 
 @router.get("/delete_device/{device_id}")
@@ -62,6 +150,11 @@ async def stop_monitoring(request: Request, device_id: str):
         raise HTTPException(status_code=404, detail="Устройство не найдено")
     return RedirectResponse(url="/", status_code=303)
 
+@router.get("/refresh_status")
+async def refresh_status(request: Request):
+    device_monitor.sync_devices()
+    return RedirectResponse(url="/", status_code=303)
+
 @router.get("/start_all_monitoring")
 async def start_all_monitoring(request: Request):
     device_monitor.start_all_monitoring()
@@ -73,13 +166,100 @@ async def stop_all_monitoring(request: Request):
     return RedirectResponse(url="/", status_code=303)
 
 @router.get("/device_results/{device_id}")
-async def device_results(request: Request, device_id: str):
+async def device_results(request: Request, device_id: str, limit: int = None):
     device = device_monitor.get_device(device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Устройство не найдено")
     
+    # История за произвольный период и по набору устройств - /api/history
     return {
-        "results": list(device.results),
+        "results": device.results.render(device.ip, limit),
         "is_online": device.is_online,
-        "last_check": device.last_check
+        "last_check": device.last_check,
+        "stats": device.stats.to_dict(),
+        "events": event_pipeline.events_for(device_id, limit=20)
     }
+
+@router.get("/events")
+async def events(request: Request, device_id: str = None, limit: int = 100):
+    """Последние события смены статуса устройств"""
+    return {"events": event_pipeline.events_for(device_id, limit=min(limit, 1000))}
+
+@router.get("/device_options")
+async def device_options(request: Request):
+    """Устройства для выбора родителя; формы дашборда загружают список при первом открытии"""
+    devices = sorted(device_monitor.devices.values(), key=lambda device: (device.name.lower(), device.ip))
+    return {"devices": [{"id": device.id, "name": device.name, "ip": device.ip} for device in devices]}
+
+@router.get("/device_history/{device_id}")
+def device_history(
+    request: Request,
+    device_id: str,
+    start: int = None,
+    end: int = None,
+    resolution: int = None
+):
+    device = device_monitor.get_device(device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Устройство не найдено")
+    if resolution is not None and resolution not in (60, 3600):
+        raise HTTPException(status_code=400, detail="Допустимое разрешение: 60 или 3600 секунд")
+
+    end = end or int(time.time())
+    start = start if start is not None else end - 3600
+    return {
+        "device_id": device_id,
+        "start": start,
+        "end": end,
+        "resolution": resolution,
+        "points": history.query(device_id, start, end, resolution)
+    }
+
+@router.get("/writer_stats")
+async def writer_stats(request: Request):
+    """Статистика пакетной записи в БД: размер и длительность сбросов"""
+    return {
+        "status": status_writer.stats(),
+        "history": history.stats()
+    }
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    """Метрики монитора в текстовом формате Prometheus"""
+    return PlainTextResponse(device_monitor.metrics_text(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _status_snapshot():
+    return json.dumps({
+        "type": "snapshot",
+        "devices": [device_monitor.device_state(device) for device in list(device_monitor.devices.values())]
+    }, ensure_ascii=False)
+
+async def _wait_disconnect(websocket):
+    """Читает входящие сообщения до отключения клиента"""
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+@router.websocket("/ws/status")
+async def status_stream(websocket: WebSocket):
+    """Поток изменений статусов: полный снимок при подключении, затем только изменения"""
+    await websocket.accept()
+    queue = status_hub.subscribe()
+    disconnected = asyncio.ensure_future(_wait_disconnect(websocket))
+    try:
+        await websocket.send_text(_status_snapshot())
+        while not disconnected.done():
+            next_message = asyncio.ensure_future(queue.get())
+            await asyncio.wait({next_message, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_message.done():
+                next_message.cancel()
+                break
+            message = next_message.result()
+            await websocket.send_text(_status_snapshot() if message is RESYNC else message)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        status_hub.unsubscribe(queue)
+        disconnected.cancel()
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import random
+import ssl
+import struct
+import time
+from urllib.parse import urlsplit
+
+from app.services.prober import (
+    ProbeResult, failed, ERROR_TIMEOUT, ERROR_UNREACHABLE, ERROR_REFUSED, ERROR_HTTP, ERROR_DNS, ERROR_SEND,
+)
+
+# Виды проверок устройства; icmp (по умолчанию) выполняется бэкендом PROBER
+CHECK_ICMP = "icmp"
+CHECK_TCP = "tcp"
+CHECK_HTTP = "http"
+CHECK_DNS = "dns"
+CHECK_TYPES = (CHECK_ICMP, CHECK_TCP, CHECK_HTTP, CHECK_DNS)
+
+# Максимальный размер тела HTTP-ответа, после чтения которого соединение переиспользуется
+HTTP_MAX_BODY = 1 << 20
+# Ошибки чтения и разбора HTTP-ответа: соединение закрывается, проверка неуспешна
+HTTP_RESPONSE_ERRORS = (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, IndexError, ValueError)
+
+
+def validate_check(check_type, check_target):
+    """Проверяет вид проверки и ее цель, возвращает нормализованную пару"""
+    check_type = (check_type or CHECK_ICMP).strip().lower()
+    check_target = str(check_target or "").strip() or None
+    if check_type not in CHECK_TYPES:
+        raise ValueError(f"Неизвестный вид проверки: {check_type}")
+    if check_type == CHECK_TCP and not (check_target and check_target.isdigit() and 0 < int(check_target) < 65536):
+        raise ValueError("Для TCP-проверки укажите порт")
+    if check_type == CHECK_HTTP and check_target and urlsplit(check_target).scheme not in ("http", "https"):
+        raise ValueError("Для HTTP-проверки укажите URL http:// или https://")
+    return (None if check_type == CHECK_ICMP else check_type), check_target
+
+
+def target_host(ip, check_type, check_target):
+    """Узел, к которому реально идет проверка, для ограничения параллельности"""
+    if check_type == CHECK_HTTP and check_target:
+        return urlsplit(check_target).hostname or ip
+    return ip
+
+
+def _connect_error(error):
+    if isinstance(error, asyncio.TimeoutError):
+        return failed(ERROR_TIMEOUT)
+    if isinstance(error, ConnectionRefusedError):
+        return failed(ERROR_REFUSED)
+    return failed(ERROR_UNREACHABLE)
+
+
+class TcpChecker:
+    """Проверка открытия TCP-соединения с портом устройства"""
+
+    async def check(self, ip, target, timeout):
+        started = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, int(target)), timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            return _connect_error(e)
+        rtt = round((time.perf_counter() - started) * 1000, 3)
+        writer.close()
+        return ProbeResult(True, rtt, None, None)
+
+    def close(self):
+        pass
+
+
+class HttpChecker:
+    """HTTP(S)-проверка с пулом keep-alive соединений.
+
+    Соединения хранятся по (схема, узел, порт) и переиспользуются
+    следующими проверками, так что TCP и TLS рукопожатия не повторяются
+    каждый интервал. Успешным считается ответ с кодом меньше 400,
+    RTT - время до получения заголовков ответа.
+    """
+
+    def __init__(self):
+        self.pool_size = int(os.getenv("HTTP_POOL_SIZE", "4"))
+        self.idle_timeout = float(os.getenv("HTTP_IDLE_TIMEOUT", "30"))
+        self.ssl_context = ssl.create_default_context()
+        if os.getenv("HTTP_VERIFY_TLS", "1") != "1":
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        # (схема, узел, порт) -> [(reader, writer, время освобождения)]
+        self._idle = {}
+
+    def _acquire(self, key):
+        idle = self._idle.get(key)
+        now = time.monotonic()
+        while idle:
+            reader, writer, released = idle.pop()
+            if now - released < self.idle_timeout and not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def _release(self, key, reader, writer):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.pool_size:
+            idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    async def check(self, ip, target, timeout):
+        url = urlsplit(target or f"http://{ip}/")
+        scheme = url.scheme
+        host = url.hostname or ip
+        port = url.port or (443 if scheme == "https" else 80)
+        path = (url.path or "/") + (f"?{url.query}" if url.query else "")
+        key = (scheme, host, port)
+        request = (
+            f"GET {path} HTTP/1.1\r\nHost: {url.netloc or host}\r\n"
+            "User-Agent: api-network-monitor\r\nAccept: */*\r\nConnection: keep-alive\r\n\r\n"
+        ).encode()
+
+        started = time.perf_counter()
+        deadline = started + timeout
+        pooled = self._acquire(key)
+        try:
+            if pooled is not None:
+                try:
+                    return await self._request(key, pooled, request, started, deadline)
+                except HTTP_RESPONSE_ERRORS:
+                    # Сервер закрыл простаивающее соединение - повторяем на новом
+                    pass
+            try:
+                connection = await asyncio.wait_for(
+                    asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == "https" else None),
+                    max(0.001, deadline - time.perf_counter()),
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                return _connect_error(e)
+            try:
+                return await self._request(key, connection, request, started, deadline)
+            except HTTP_RESPONSE_ERRORS:
+                return failed(ERROR_HTTP)
+        except asyncio.TimeoutError:
+            return failed(ERROR_TIMEOUT)
+
+    async def _request(self, key, connection, request, started, deadline):
+        reader, writer = connection
+        writer.write(request)
+        try:
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), max(0.001, deadline - time.perf_counter()))
+            rtt = round((time.perf_counter() - started) * 1000, 3)
+
+            lines = head.decode("latin-1").split("\r\n")
+            status = int(lines[0].split(" ", 2)[1])
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            reusable = await self._drain_body(reader, headers, deadline)
+        except (asyncio.TimeoutError,) + HTTP_RESPONSE_ERRORS:
+            writer.close()
+            raise
+        if reusable and headers.get("connection", "").lower() != "close":
+            self._release(key, reader, writer)
+        else:
+            writer.close()
+
+        if status >= 400:
+            return ProbeResult(False, rtt, None, ERROR_HTTP)
+        return ProbeResult(True, rtt, None, None)
+
+    async def _drain_body(self, reader, headers, deadline):
+        """Дочитывает тело ответа; возвращает, можно ли переиспользовать соединение"""
+        def remaining():
+            return max(0.001, deadline - time.perf_counter())
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            total = 0
+            while True:
+                size = int((await asyncio.wait_for(reader.readline(), remaining())).split(b";")[0], 16)
+                total += size
+                if total > HTTP_MAX_BODY:
+                    return False
+                await asyncio.wait_for(reader.readexactly(size + 2), remaining())
+                if size == 0:
+                    return True
+        length = headers.get("content-length")
+        if length is None or int(length) > HTTP_MAX_BODY:
+            return False
+        await asyncio.wait_for(reader.readexactly(int(length)), remaining())
+        return True
+
+    def close(self):
+        for idle in self._idle.values():
+            for _, writer, _ in idle:
+                try:
+                    writer.close()
+                except RuntimeError:
+                    # Цикл событий уже закрыт
+                    pass
+        self._idle.clear()
+
+
+class _DnsProtocol(asyncio.DatagramProtocol):
+    def __init__(self, query_id, future):
+        self.query_id = query_id
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if len(data) >= 12 and struct.unpack("!H", data[:2])[0] == self.query_id and not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+class DnsChecker:
+    """Проверка DNS-сервера на устройстве.
+
+    Запрашивается A-запись имени из check_target (по умолчанию localhost),
+    успешным считается ответ с кодом NOERROR.
+    """
+
+    def _query(self, query_id, name):
+        question = b"".join(bytes([len(label)]) + label.encode("idna") for label in name.strip(".").split(".") if label)
+        return struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + question + b"\x00" + struct.pack("!HH", 1, 1)
+
+    async def check(self, ip, target, timeout):
+        loop = asyncio.get_running_loop()
+        query_id = random.getrandbits(16)
+        future = loop.create_future()
+        started = time.perf_counter()
+        try:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DnsProtocol(query_id, future), remote_addr=(ip, 53)
+            )
+        except OSError:
+            return failed(ERROR_SEND)
+        try:
+            transport.sendto(self._query(query_id, target or "localhost"))
+            response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return failed(ERROR_TIMEOUT)
+        except ConnectionRefusedError:
+            return failed(ERROR_REFUSED)
+        except OSError:
+            return failed(ERROR_UNREACHABLE)
+        finally:
+            transport.close()
+        rtt = round((time.perf_counter() - started) * 1000, 3)
+        if struct.unpack("!H", response[2:4])[0] & 0x000F:
+            return ProbeResult(False, rtt, None, ERROR_DNS)
+        return ProbeResult(True, rtt, None, None)
+
+    def close(self):
+        pass
+
+
+CHECKERS = {
+    CHECK_TCP: TcpChecker,
+    CHECK_HTTP: HttpChecker,
+    CHECK_DNS: DnsChecker,
+}
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import threading
+import time
+
+from app.services.checks import CHECK_ICMP, CHECKERS, target_host
+from app.services.metrics import PROBES, PROBE_DURATION
+from app.services.prober import create_prober
+from app.services.policy import ProbePolicy
+from app.services.scheduler import ProbeScheduler
+
+
+class Target:
+    """Минимальное описание устройства для проверки вне основного процесса"""
+
+    __slots__ = ("id", "ip", "tags", "check_interval", "is_online", "parent_down", "check_type", "check_target")
+
+    def __init__(self, id, ip, tags=None, check_interval=None, is_online=None, parent_down=False,
+                 check_type=None, check_target=None):
+        self.id = id
+        self.ip = ip
+        self.tags = tags or []
+        self.check_interval = check_interval
+        self.is_online = is_online
+        self.parent_down = parent_down
+        self.check_type = check_type
+        self.check_target = check_target
+
+    @classmethod
+    def from_device(cls, device):
+        return cls(device.id, device.ip, list(device.tags), device.check_interval, device.is_online,
+                   device.parent_down, device.check_type, device.check_target)
+
+    def to_tuple(self):
+        return (self.id, self.ip, self.tags, self.check_interval, self.is_online, self.parent_down,
+                self.check_type, self.check_target)
+
+
+class ProbeEngine:
+    """Проверки набора устройств: планировщик, бэкенд проверок и политика расписания.
+
+    Результат каждой проверки передается в report(device_id, checked_at,
+    result, confirmed, next_check), где confirmed - подтвержденный политикой
+    статус, а next_check - время следующей проверки (epoch).
+    Движок работает одинаково в основном процессе и в процессах-воркерах.
+
+    ICMP выполняет бэкенд PROBER, проверки TCP, HTTP и DNS - проверяющие
+    из checks на том же цикле событий. Одновременных проверок одного узла
+    не больше max_per_target, чтобы сотни устройств за одним адресом
+    (например, URL одного сервера) не перегружали его.
+    """
+
+    def __init__(self, report, interval=None, timeout=None, prober=None, rate=None):
+        self.report = report
+        self.interval = interval or int(os.getenv("CHECK_INTERVAL", "5"))
+        self.timeout = timeout or float(os.getenv("PING_TIMEOUT", "0.5"))
+        self.targets = {}
+        self.prober = prober or create_prober()
+        self.policy = ProbePolicy(self.interval)
+        # Имитация сети отвечает и за остальные виды проверок
+        self.simulated = getattr(self.prober, "name", None) == "simulated"
+        self.checkers = {}
+        self.max_per_target = int(os.getenv("MAX_PER_TARGET", "4"))
+        # узел -> семафор; создаются при первой проверке узла и удаляются,
+        # когда узел больше не проверяет ни одно устройство
+        self.target_limits = {}
+        # узел -> число устройств, которые его проверяют
+        self._host_refs = {}
+        self._hosts_lock = threading.Lock()
+        self.scheduler = ProbeScheduler(
+            self.check, self.interval,
+            max_concurrency=int(os.getenv("MAX_CONCURRENT_PROBES", "100")),
+            # 0 - без ограничения; воркеры получают свою долю общего бюджета
+            rate=float(os.getenv("MAX_PROBES_PER_SECOND", "0")) if rate is None else rate,
+        )
+
+    def add(self, target, delay=None):
+        """Ставит устройство на проверку; повторный вызов обновляет его параметры.
+
+        Для уже запланированного устройства явная задержка переносит
+        следующую проверку.
+        """
+        previous = self.targets.get(target.id)
+        self.targets[target.id] = target
+        self._track_host(target, previous)
+        if previous is None or delay is not None:
+            self.scheduler.schedule(target.id, delay)
+
+    def remove(self, device_id):
+        previous = self.targets.pop(device_id, None)
+        if previous is not None:
+            self._track_host(None, previous)
+        self.scheduler.cancel(device_id)
+        self.policy.forget(device_id)
+
+    @staticmethod
+    def _host(target):
+        return target_host(target.ip, target.check_type or CHECK_ICMP, target.check_target)
+
+    def _track_host(self, target, previous):
+        """Учитывает смену узла устройства; семафор узла без устройств удаляется"""
+        host = self._host(target) if target is not None else None
+        old = self._host(previous) if previous is not None else None
+        if host == old:
+            return
+        with self._hosts_lock:
+            if host is not None:
+                self._host_refs[host] = self._host_refs.get(host, 0) + 1
+            if old is not None:
+                refs = self._host_refs.get(old, 0) - 1
+                if refs > 0:
+                    self._host_refs[old] = refs
+                else:
+                    self._host_refs.pop(old, None)
+                    self.target_limits.pop(old, None)
+
+    def __len__(self):
+        return len(self.targets)
+
+    async def check(self, device_id):
+        """Однократная проверка устройства, вызывается планировщиком"""
+        target = self.targets.get(device_id)
+        if target is None:
+            return None
+
+        started = time.perf_counter()
+        result = await self._probe(target)
+        PROBE_DURATION.observe(time.perf_counter() - started)
+        PROBES.inc("ok" if result.ok else result.error)
+        if device_id not in self.targets:
+            # Устройство сняли с проверки, пока шла проверка
+            return None
+        checked_at = time.time()
+        # Статус меняется только после подтверждения повторными проверками
+        confirmed, delay = self.policy.update(target, result.ok)
+        self.report(device_id, checked_at, result, confirmed, checked_at + delay)
+        return delay
+
+    async def _probe(self, target):
+        check_type = target.check_type or CHECK_ICMP
+        host = self._host(target)
+        limit = self.target_limits.get(host)
+        if limit is None:
+            limit = asyncio.Semaphore(self.max_per_target)
+            with self._hosts_lock:
+                # Устройство могли снять с проверки - тогда семафор не сохраняется
+                if host in self._host_refs:
+                    limit = self.target_limits.setdefault(host, limit)
+        async with limit:
+            if check_type == CHECK_ICMP or self.simulated:
+                return await self.prober.ping(target.ip, self.timeout)
+            checker = self.checkers.get(check_type)
+            if checker is None:
+                checker = self.checkers[check_type] = CHECKERS[check_type]()
+            return await checker.check(target.ip, target.check_target, self.timeout)
+
+    def shutdown(self):
+        self.scheduler.shutdown()
+        self.prober.close()
+        for checker in self.checkers.values():
+            checker.close()
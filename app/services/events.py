@@ -0,0 +1,390 @@
+import asyncio
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import urllib.request
+from collections import deque, namedtuple
+
+from app.models.results import format_time
+from app.services.metrics import registry
+
+# Виды событий: начальный статус, подтвержденные переходы и сводка при массовом сбое
+EVENT_INITIAL = "initial"
+EVENT_UP = "up"
+EVENT_DOWN = "down"
+EVENT_FLOOD = "flood"
+# Зависимые устройства стали недоступны через родителя (online=False) или снова проверяются
+EVENT_DEPENDENTS = "dependents"
+
+# Событие смены статуса устройства; ts - время проверки (epoch),
+# online - подтвержденный статус после события, dependents - ID
+# зависимых устройств для сгруппированного события
+Event = namedtuple("Event", "kind device_id ip name ts online dependents", defaults=(None,))
+
+EVENTS = registry.counter("netmon_events_total", "События смены статуса устройств", ("kind",))
+SUPPRESSED = registry.counter("netmon_events_suppressed_total", "События, не отправленные получателям", ("reason",))
+DELIVERIES = registry.counter("netmon_event_deliveries_total", "Отправки пакетов событий", ("sink", "result"))
+
+
+def event_message(event):
+    if event.kind == EVENT_UP:
+        return f"Устройство {event.name} ({event.ip}) ДОСТУПНО"
+    if event.kind == EVENT_DOWN:
+        return f"Устройство {event.name} ({event.ip}) НЕДОСТУПНО"
+    if event.kind == EVENT_DEPENDENTS:
+        if event.online:
+            return f"Устройство {event.name} ({event.ip}) доступно, зависимые устройства ({len(event.dependents)}) снова проверяются"
+        return f"Зависимые устройства ({len(event.dependents)}) недоступны через {event.name} ({event.ip})"
+    status = "ДОСТУПЕН" if event.online else "НЕДОСТУПЕН"
+    return f"Устройство {event.name} ({event.ip}): начальный статус {status}"
+
+
+def event_to_dict(event):
+    data = {
+        "kind": event.kind,
+        "device_id": event.device_id,
+        "ip": event.ip,
+        "name": event.name,
+        "time": format_time(event.ts),
+        "online": event.online,
+        "message": event_message(event),
+    }
+    if event.dependents is not None:
+        data["dependents"] = event.dependents
+    return data
+
+
+class WebhookSink:
+    """POST пакета событий в JSON на указанный URL"""
+
+    name = "webhook"
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        request = urllib.request.Request(self.url, body, {"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SyslogSink:
+    """Отправка событий в syslog: адрес host:port (UDP) или путь к сокету"""
+
+    name = "syslog"
+
+    def __init__(self, address):
+        if ":" in address:
+            host, port = address.rsplit(":", 1)
+            address = (host, int(port))
+        self.handler = logging.handlers.SysLogHandler(address=address)
+        self.logger = logging.Logger("netmon.events")
+        self.logger.addHandler(self.handler)
+
+    def send(self, payload):
+        for item in payload["events"]:
+            level = logging.WARNING if item["kind"] in (EVENT_DOWN, EVENT_FLOOD) else logging.INFO
+            self.logger.log(level, "netmon: %s", item["message"])
+
+    def close(self):
+        self.handler.close()
+
+
+class FileSink:
+    """Дописывает события в файл по одному JSON-объекту в строке"""
+
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, payload):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for item in payload["events"]:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+SINKS = {
+    "webhook": WebhookSink,
+    "syslog": SyslogSink,
+    "file": FileSink,
+}
+
+
+def create_sinks(value):
+    """Создает получателей из строки: file:events.log,webhook:http://host/hook,syslog:localhost:514"""
+    sinks = []
+    for item in (value or "").split(","):
+        kind, _, target = item.strip().partition(":")
+        if not kind:
+            continue
+        if kind not in SINKS or not target:
+            raise ValueError(f"Некорректный получатель событий: {item}")
+        sinks.append(SINKS[kind](target))
+    return sinks
+
+
+class EventPipeline:
+    """Доставка событий смены статуса получателям.
+
+    Монитор передает события из любого потока в emit; они попадают в
+    asyncio-очередь отдельного потока, собираются в пакеты и рассылаются
+    всем получателям с повторами при ошибках. Частые события одного
+    устройства (дребезг) ограничиваются, а если за flood_window секунд
+    набралось больше flood_threshold переходов (например, упал общий
+    канал), каждый пакет вместо сотен событий сворачивается в одно
+    сводное, пока поток переходов не спадет вдвое. Из событий, не
+    прошедших ограничение, запоминается последнее по каждому устройству:
+    когда окно освобождается, оно отправляется, если итоговый статус
+    отличается от последнего доставленного.
+    """
+
+    def __init__(self, sinks=None):
+        # Получатели из EVENT_SINKS создаются при первом событии
+        self._sinks = sinks
+        self.batch_interval = float(os.getenv("EVENT_BATCH_INTERVAL", "2"))
+        self.batch_size = int(os.getenv("EVENT_BATCH_SIZE", "1000"))
+        self.retries = int(os.getenv("EVENT_RETRIES", "3"))
+        self.device_limit = int(os.getenv("EVENT_DEVICE_LIMIT", "5"))
+        self.device_period = float(os.getenv("EVENT_DEVICE_PERIOD", "300"))
+        self.flood_threshold = int(os.getenv("EVENT_FLOOD_THRESHOLD", "50"))
+        self.flood_window = float(os.getenv("EVENT_FLOOD_WINDOW", "30"))
+        self.queue_size = int(os.getenv("EVENT_QUEUE_SIZE", "10000"))
+        # Последние события для API независимо от получателей
+        self.recent = deque(maxlen=int(os.getenv("EVENT_LOG_SIZE", "1000")))
+        # device_id -> время последних отправленных событий
+        self._sent = {}
+        # Последнее задержанное ограничением событие и последний доставленный
+        # статус; ключ - устройство и вид (собственный статус или зависимые)
+        self._pending = {}
+        self._delivered = {}
+        # Время недавних переходов всех устройств для обнаружения массового сбоя
+        self._transitions = deque()
+        self._flooding = False
+        self._queue = None
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def sinks(self):
+        if self._sinks is None:
+            try:
+                self._sinks = create_sinks(os.getenv("EVENT_SINKS", ""))
+            except ValueError:
+                # Ошибка настройки сообщается один раз, дальше события не рассылаются
+                self._sinks = []
+                raise
+        return self._sinks
+
+    def load_sinks(self):
+        """Создает получателей из EVENT_SINKS при запуске приложения.
+
+        Ошибка в настройке (ValueError) выявляется при старте, а не при
+        первом событии.
+        """
+        return self.sinks
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run_loop, name="event-pipeline")
+            self._thread.daemon = True
+            self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(self.queue_size)
+        task = self._loop.create_task(self._deliver())
+        self._ready.set()
+        self._loop.run_until_complete(task)
+        self._loop.close()
+
+    def emit(self, event):
+        """Регистрирует событие; вызывается из любого потока.
+
+        Не выбрасывает исключений: emit вызывается из обработки результата
+        проверки, и ошибка доставки не должна прерывать запись статуса.
+        """
+        EVENTS.inc(event.kind)
+        self.recent.append(event)
+        if event.kind == EVENT_INITIAL:
+            return
+        try:
+            if not self.sinks:
+                return
+            if self._thread is None:
+                self.start()
+            self._loop.call_soon_threadsafe(self._enqueue, event)
+        except Exception as e:
+            SUPPRESSED.inc("error")
+            print(f"Не удалось передать событие получателям: {e}")
+
+    def _enqueue(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            SUPPRESSED.inc("queue_full")
+
+    def events_for(self, device_id=None, limit=100):
+        """Последние события, новые первыми"""
+        events = [e for e in reversed(self.recent) if device_id is None or e.device_id == device_id]
+        return [event_to_dict(event) for event in events[:limit]]
+
+    def _allowed(self, event, now):
+        """Ограничение числа событий одного устройства за device_period"""
+        sent = self._sent.get(event.device_id)
+        if sent is None:
+            sent = self._sent[event.device_id] = deque()
+        while sent and sent[0] <= now - self.device_period:
+            sent.popleft()
+        if len(sent) >= self.device_limit:
+            return False
+        sent.append(now)
+        return True
+
+    @staticmethod
+    def _state_key(event):
+        return event.device_id, event.kind == EVENT_DEPENDENTS
+
+    def _release_delay(self):
+        """Секунды до освобождения окна для задержанного события (None - ждать нечего)"""
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        reopen = min(
+            self._sent[device_id][0] + self.device_period if self._sent.get(device_id) else now
+            for device_id, _ in self._pending
+        )
+        return max(reopen - now, 0)
+
+    def _release(self, now, force=False):
+        """Задержанные события, чье окно освободилось (force - все при остановке)"""
+        released = []
+        for key, event in list(self._pending.items()):
+            if self._delivered.get(key) == event.online:
+                # Устройство вернулось в уже доставленное состояние
+                del self._pending[key]
+            elif force or self._allowed(event, now):
+                del self._pending[key]
+                released.append(event)
+        return released
+
+    async def _collect(self):
+        """Ждет первое событие и добирает пакет в течение batch_interval.
+
+        Пустой пакет возвращается, когда пора отправить задержанные события.
+        """
+        try:
+            event = await asyncio.wait_for(self._queue.get(), self._release_delay())
+        except asyncio.TimeoutError:
+            return []
+        if event is None:
+            return None
+        batch = [event]
+        deadline = self._loop.time() + self.batch_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if event is None:
+                self._queue.put_nowait(None)
+                break
+            batch.append(event)
+        return batch
+
+    def _prepare(self, batch, final=False):
+        """Применяет ограничения и сворачивает массовые сбои в одно событие"""
+        now = time.monotonic()
+        transitions = self._transitions
+        transitions.extend([now] * len(batch))
+        while transitions and transitions[0] <= now - self.flood_window:
+            transitions.popleft()
+        if len(transitions) > self.flood_threshold:
+            self._flooding = True
+        elif len(transitions) <= self.flood_threshold // 2:
+            self._flooding = False
+
+        allowed = []
+        for event in batch:
+            if self._allowed(event, now):
+                self._pending.pop(self._state_key(event), None)
+                allowed.append(event)
+            else:
+                self._pending[self._state_key(event)] = event
+                SUPPRESSED.inc("rate_limit")
+        allowed.extend(self._release(now, final))
+        for event in allowed:
+            self._delivered[self._state_key(event)] = event.online
+        if not self._flooding or not allowed:
+            return [event_to_dict(event) for event in allowed]
+
+        SUPPRESSED.inc("flood", amount=len(allowed))
+        counts = {}
+        for event in allowed:
+            counts[event.kind] = counts.get(event.kind, 0) + 1
+        return [{
+            "kind": EVENT_FLOOD,
+            "time": format_time(allowed[-1].ts),
+            "counts": counts,
+            "devices": [event.device_id for event in allowed],
+            "message": "Массовая смена статуса: " + ", ".join(
+                f"{kind} - {count}" for kind, count in sorted(counts.items())
+            ),
+        }]
+
+    async def _send(self, sink, payload):
+        """Отправка пакета одному получателю с экспоненциальной паузой между попытками"""
+        for attempt in range(self.retries + 1):
+            try:
+                await self._loop.run_in_executor(None, sink.send, payload)
+                DELIVERIES.inc(sink.name, "ok")
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    DELIVERIES.inc(sink.name, "failed")
+                    print(f"Не удалось отправить события ({sink.name}): {e}")
+                    return
+                DELIVERIES.inc(sink.name, "retry")
+                await asyncio.sleep(min(2 ** attempt, 30))
+
+    async def _deliver(self):
+        while True:
+            batch = await self._collect()
+            # При остановке задержанные события отправляются без ограничения
+            final = batch is None
+            events = self._prepare(batch or [], final)
+            if events:
+                payload = {"events": events}
+                await asyncio.gather(*(self._send(sink, payload) for sink in self.sinks))
+            if final:
+                return
+
+    def close(self):
+        """Отправляет накопленные события и останавливает поток"""
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._queue.put(None), self._loop)
+        self._thread.join(timeout=self.batch_interval + 10)
+        self._thread = None
+        for sink in self._sinks or ():
+            if hasattr(sink, "close"):
+                sink.close()
+
+
+# Глобальный экземпляр для монитора и маршрутов
+event_pipeline = EventPipeline()
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import os
+import threading
+
+# Служебное сообщение: подписчик отстал и должен получить полный снимок
+RESYNC = object()
+
+
+class StatusHub:
+    """Раздача изменений статусов устройств всем подключенным клиентам.
+
+    Монитор публикует изменения из любого потока; они объединяются по
+    устройству и раз в flush_interval рассылаются одним сообщением,
+    которое сериализуется один раз для всех подписчиков.
+    """
+
+    def __init__(self, flush_interval=None, queue_size=100):
+        self.flush_interval = flush_interval or float(os.getenv("STATUS_PUSH_INTERVAL", "1"))
+        self.queue_size = queue_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._task = None
+
+    def publish(self, device_id, state):
+        """Публикует новое состояние устройства (None - устройство удалено)"""
+        if not self._subscribers:
+            return
+        with self._lock:
+            self._pending[device_id] = state if state is not None else {"id": device_id, "deleted": True}
+
+    def subscribe(self):
+        """Регистрирует подписчика, вызывается из цикла событий веб-сервера"""
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._broadcast())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def _offer(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Медленный клиент: отбрасываем накопленное и просим полный снимок
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+    async def _broadcast(self):
+        while self._subscribers:
+            await asyncio.sleep(self.flush_interval)
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                continue
+            message = json.dumps({"type": "delta", "devices": list(batch.values())}, ensure_ascii=False)
+            for queue in list(self._subscribers):
+                self._offer(queue, message)
+        with self._lock:
+            self._pending.clear()
+
+
+# Глобальный экземпляр для монитора и маршрутов
+status_hub = StatusHub()
@@ -0,0 +1,187 @@
+import threading
+from bisect import bisect_left
+
+# Границы корзин гистограмм длительностей в секундах
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Метрика с отдельным набором значений в каждом потоке.
+
+    Поток пишет только в свои значения, поэтому в горячем пути нет
+    блокировок; блокировка берется один раз при первой записи потока и
+    при сборе, который суммирует значения всех потоков.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.reset()
+
+    def reset(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _values(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def snapshot(self):
+        """Сумма значений всех потоков: {значения меток: значение}"""
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            for key, value in list(shard.items()):
+                merged[key] = self._merge(merged.get(key), value)
+        return merged
+
+    def _merge(self, total, value):
+        raise NotImplementedError
+
+    def expose(self, values):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        values = self._values()
+        values[labels] = values.get(labels, 0) + amount
+
+    def _merge(self, total, value):
+        return value if total is None else total + value
+
+    def expose(self, values):
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        values = self._values()
+        # [счетчики корзин..., +Inf, сумма]
+        row = values.get(labels)
+        if row is None:
+            row = values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def _merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def expose(self, values):
+        names = self.labels + ("le",)
+        for key, row in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), row):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_number(row[-1])}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {cumulative}"
+
+
+class Registry:
+    """Набор метрик процесса и вывод в текстовом формате Prometheus.
+
+    Метрики процессов-воркеров приходят снимками и суммируются с
+    метриками основного процесса. Значения, которые проще вычислить при
+    сборе (статусы устройств, число активных мониторов), задаются
+    функциями-источниками.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.gauges = []
+
+    def counter(self, name, help, labels=()):
+        return self.metrics.setdefault(name, Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, labels, collect):
+        """Регистрирует gauge, значения которого возвращает collect() как (метки, значение)"""
+        self.gauges.append((name, help, tuple(labels), collect))
+
+    def reset(self):
+        """Обнуляет метрики, например в процессе-воркере после fork"""
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def snapshot(self, remote=()):
+        """Значения всех метрик; remote - снимки других процессов для суммирования"""
+        merged = {}
+        for name, metric in self.metrics.items():
+            values = merged[name] = metric.snapshot()
+            for snapshot in remote:
+                for key, value in snapshot.get(name, {}).items():
+                    values[key] = metric._merge(values.get(key), value)
+        return merged
+
+    def expose(self, remote=()):
+        """Все метрики в текстовом формате; remote - снимки других процессов"""
+        lines = []
+        for name, values in self.snapshot(remote).items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.expose(values))
+        for name, help, labels, collect in self.gauges:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in collect():
+                lines.append(f"{name}{_labels(labels, key)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Метрики процесса: в воркерах свой экземпляр, снимок которого
+# отправляется в основной процесс вместе с результатами
+registry = Registry()
+
+PROBES = registry.counter("netmon_probes_total", "Выполненные проверки по результату", ("result",))
+PROBE_DURATION = registry.histogram("netmon_probe_duration_seconds", "Длительность одной проверки")
+SCHEDULER_LATENESS = registry.histogram(
+    "netmon_scheduler_lateness_seconds", "Отставание фактического запуска проверки от запланированного"
+)
+DEVICE_SAVE_DURATION = registry.histogram("netmon_device_save_duration_seconds", "Длительность Device.save")
+DB_FLUSH_DURATION = registry.histogram(
+    "netmon_db_flush_duration_seconds", "Длительность пакетной записи в БД", ("writer",)
+)
+DB_FLUSH_ROWS = registry.counter("netmon_db_flush_rows_total", "Записанные пакетной записью строки", ("writer",))
@@ -1,140 +1,452 @@
-import subprocess
-import platform
+import os
+import random
 import threading
 import time
-import os
-from datetime import datetime
-from dotenv import load_dotenv
-
-from app.models.device import Device
-from app import db
 
-# Загрузка переменных окружения
-load_dotenv()
+from app.models.device import Device, parse_tags, STATS_WINDOW, RESULTS_SIZE
+from app.services.prober import status_code, result_from_status
+from app.services.checks import validate_check
+from app.services.engine import ProbeEngine
+from app.services.policy import ProbePolicy, validate_interval
+from app.services.workers import WorkerPool
+from app.services.hub import status_hub
+from app.services.metrics import registry
+from app.services.events import (
+    event_pipeline, Event, EVENT_INITIAL, EVENT_UP, EVENT_DOWN, EVENT_DEPENDENTS, SUPPRESSED
+)
+from app.database import history, status_writer
 
 class DeviceMonitor:
     def __init__(self):
         self.check_interval = int(os.getenv("CHECK_INTERVAL", "5"))  # Интервал из .env
         self.ping_timeout = float(os.getenv("PING_TIMEOUT", "0.5"))  # Таймаут из .env
+        self.worker_count = int(os.getenv("MONITOR_WORKERS", "0"))  # 0 - проверки в этом процессе
+        self.auto_resume = os.getenv("AUTO_RESUME", "1") == "1"  # Возобновлять мониторинг при старте
         self.devices = {}
         self.monitoring_status = {}
-        self.monitoring_threads = {}
+        # Устройства, чье событие "недоступно" подавлено из-за недоступного родителя
+        self.silenced = set()
+        # Устройства, чье событие "недоступно" ждет перепроверки родителя: id -> время
+        self.held = {}
+        self.rechecks = {}
+        # parent_id -> зависимые устройства; перестраивается после изменений
+        self._children = None
+        self.policy = ProbePolicy(self.check_interval)
+        # Проверки выполняются либо движком в этом процессе, либо пулом
+        # процессов-воркеров; результаты в обоих случаях приходят в apply_result
+        self.engine = None
+        self.workers = None
+        self.started = False
+        self._start_lock = threading.Lock()
 
-    def ping_host(self, ip):
-        is_windows = platform.system().lower() == "windows"
-        
-        if is_windows:
-            # В Windows используем другой формат команды
-            # Для Windows таймаут указывается в миллисекундах
-            timeout_ms = int(self.ping_timeout * 1000)
-            command = f"ping -n 1 -w {timeout_ms} {ip}"
-        else:
-            # Для Linux/Mac таймаут указывается в секундах
-            command = f"ping -c 1 -W {self.ping_timeout} {ip}"
-
-        try:
-            if is_windows:
-                # Для Windows используем shell=True и кодировку cp866
-                output = subprocess.check_output(
-                    command, stderr=subprocess.STDOUT,
-                    shell=True, text=True, encoding='cp866',
-                    timeout=self.ping_timeout * 2  # Общий таймаут процесса
-                )
+    def start(self):
+        """Однократная инициализация: бэкенд проверок, реестр устройств и метрики.
+
+        Вызывается при запуске приложения, а не при импорте модуля, чтобы
+        импорт не открывал БД и сокеты. Реестр устройств в памяти
+        загружается один раз и дальше обновляется вместе с БД.
+        """
+        with self._start_lock:
+            if self.started:
+                return
+            if self.worker_count > 0:
+                self.workers = WorkerPool(self.worker_count, self.apply_result)
             else:
-                # Для Linux/Mac
-                output = subprocess.check_output(
-                    command, stderr=subprocess.STDOUT,
-                    shell=True, universal_newlines=True,
-                    timeout=self.ping_timeout * 2  # Общий таймаут процесса
-                )
-            
-            # Проверяем результат пинга
-            if "TTL=" in output or "ttl=" in output:
-                return True
-            return False
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
-            return False
+                self.engine = ProbeEngine(self.apply_result, self.check_interval, self.ping_timeout)
+            self.load_devices()
+            self.register_metrics()
+            self.started = True
 
-    def monitor_device(self, device_id):
-        device = self.get_device(device_id)
-        if not device:
+    def load_devices(self):
+        """Загружает все устройства из БД в реестр"""
+        for device in Device.get_all():
+            self.devices[device.id] = device
+        for device in self.devices.values():
+            device.parent_down = self.ancestor_down(device)
+        self.warm_stats()
+
+    def warm_stats(self):
+        """Заполняет статистику устройств последними проверками из истории.
+
+        Статус и время последней проверки уже загружены из таблицы devices,
+        так что дашборд после перезапуска сразу показывает прежнее состояние.
+        """
+        since = time.time() - 24 * 3600
+        for device_id, ts, status, rtt in history.recent(max(STATS_WINDOW, RESULTS_SIZE), since):
+            device = self.devices.get(device_id)
+            if device:
+                device.stats.add(result_from_status(status, rtt))
+                device.results.append(ts, status, rtt)
+
+    def resume_monitoring(self):
+        """Возобновляет мониторинг устройств, которые наблюдались до перезапуска.
+
+        Устройства, срок проверки которых еще не наступил, проверяются в
+        сохраненное время. Просроченные равномерно распределяются по своему
+        интервалу, чтобы не проверять все устройства одновременно.
+        """
+        if not self.auto_resume:
+            return 0
+        now = time.time()
+        resumed = [device for device in self.devices.values() if device.monitoring]
+        overdue = [device for device in resumed if not device.next_check or device.next_check <= now]
+        for device in resumed:
+            if device.next_check and device.next_check > now:
+                self.start_monitoring(device.id, device.next_check - now)
+        for index, device in enumerate(overdue):
+            self.start_monitoring(device.id, self.policy.interval_for(device) * index / len(overdue))
+        return len(resumed)
+
+    def register_metrics(self):
+        """Gauge-метрики, вычисляемые по реестру при каждом сборе"""
+        labels = ("id", "ip", "name")
+        registry.gauge("netmon_device_up", "Подтвержденный статус устройства (1 - доступно)", labels, lambda: (
+            ((d.id, d.ip, d.name), d.is_online) for d in list(self.devices.values()) if d.is_online is not None
+        ))
+        registry.gauge("netmon_device_rtt_seconds", "RTT последней успешной проверки", labels, lambda: (
+            ((d.id, d.ip, d.name), d.stats.last_rtt / 1000)
+            for d in list(self.devices.values()) if d.stats.last_rtt is not None
+        ))
+        registry.gauge("netmon_monitors_active", "Число устройств на мониторинге", (), lambda: [
+            ((), sum(1 for active in list(self.monitoring_status.values()) if active))
+        ])
+        registry.gauge("netmon_scheduled_probes", "Число устройств в расписании проверок", (), lambda: [
+            ((), len(self.workers.assignments) if self.workers else len(self.engine))
+        ])
+        registry.gauge("netmon_status_subscribers", "Подключенные клиенты потока статусов", (), lambda: [
+            ((), status_hub.subscriber_count())
+        ])
+        if self.workers:
+            registry.gauge("netmon_worker_devices", "Число устройств на воркере", ("worker",), lambda: (
+                ((str(index),), count) for index, count in self.workers.counts().items()
+            ))
+
+    def metrics_snapshot(self):
+        """Значения метрик этого процесса вместе с метриками процессов-воркеров"""
+        return registry.snapshot(list(self.workers.metrics.values()) if self.workers else [])
+
+    def metrics_text(self):
+        """Метрики в формате Prometheus вместе с метриками процессов-воркеров"""
+        return registry.expose(list(self.workers.metrics.values()) if self.workers else [])
+
+    def apply_result(self, device_id, checked_at, result, confirmed, next_check):
+        """Применяет результат проверки к устройству в реестре"""
+        device = self.devices.get(device_id)
+        # Проверка, начатая до остановки мониторинга или удаления
+        # устройства, завершается позже - ее результат отбрасывается
+        if not device or not self.monitoring_status.get(device_id, False):
             return
-        
-        # Создаем отдельный поток для каждого устройства
-        while self.monitoring_status.get(device_id, False):
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            is_online = self.ping_host(device.ip)
 
-            # Сохраняем результат
-            device.last_check = current_time
-            
-            # Всегда обновляем статус устройства
-            device.is_online = is_online
+        code = status_code(result)
+        device.stats.add(result)
+        history.append(device_id, checked_at, code, result.rtt)
+        # Результат хранится компактной записью, сообщение формируется при чтении
+        device.results.append(checked_at, code, result.rtt)
 
-            # Добавляем записи в историю при изменении статуса
-            if device.is_online is None:
-                # Первая проверка
-                status = "ДОСТУПЕН" if is_online else "НЕДОСТУПЕН"
-                message = f"[{current_time}] Начальный статус: {status}"
-                device.results.append({"time": current_time, "status": status, "message": message})
-            elif not is_online:
-                # Устройство недоступно
-                message = f"[{current_time}] ⚠️ Устройство {device.ip} НЕДОСТУПНО"
-                device.results.append({"time": current_time, "status": "НЕДОСТУПЕН", "message": message})
-            elif is_online:
-                # Устройство доступно
-                message = f"[{current_time}] ✅ Устройство {device.ip} ДОСТУПНО"
-                device.results.append({"time": current_time, "status": "ДОСТУПЕН", "message": message})
-            
-            # Сохраняем изменения в БД
-            device.save()
-            
-            # Используем интервал из настроек
-            time.sleep(self.check_interval)
+        # Сохраняем результат
+        device.checked_at = checked_at
+        device.next_check = next_check
+        device.version += 1
+
+        # Статус подтвержден политикой расписания повторными проверками,
+        # поэтому смена статуса - настоящий переход, а не единичный сбой
+        previous = device.is_online
+        status_changed = previous != confirmed
+        device.is_online = confirmed
+        emitted = False
+        if status_changed:
+            emitted = self.emit_transition(device, previous, checked_at)
+        if self.held or self.silenced:
+            self.resolve_dependents(device, result.ok, checked_at)
+
+        # Статус попадает в БД пакетом вместе с обновлениями других устройств
+        status_writer.submit(device.to_db_row())
+        if status_changed:
+            self.publish(device)
+            if previous is not None:
+                # Общее событие по зависимым - только если о самом устройстве сообщили
+                self.update_dependents(device, checked_at if emitted else None)
+
+    def emit_transition(self, device, previous, checked_at):
+        """Событие смены статуса; переходы за недоступным родителем не отправляются.
+
+        Если родитель еще не признан недоступным, событие "недоступно"
+        откладывается до его внеочередной проверки: при общем сбое
+        зависимые устройства часто подтверждают сбой раньше родителя.
+        Возвращает True, если событие отправлено.
+        """
+        if previous is None:
+            kind = EVENT_INITIAL
+        elif device.is_online:
+            kind = EVENT_UP
+            if device.id in self.silenced or self.held.pop(device.id, None) is not None:
+                # О недоступности не сообщали - не сообщаем и о восстановлении
+                self.silenced.discard(device.id)
+                SUPPRESSED.inc("parent")
+                return False
+        else:
+            kind = EVENT_DOWN
+            if device.parent_down or self.parent_failing(device):
+                self.silenced.add(device.id)
+                SUPPRESSED.inc("parent")
+                return False
+            parent = self.devices.get(device.parent_id) if device.parent_id else None
+            if parent is not None and self.monitoring_status.get(parent.id, False):
+                self.held[device.id] = checked_at
+                self.recheck(parent)
+                return False
+        event_pipeline.emit(Event(kind, device.id, device.ip, device.name, checked_at, device.is_online))
+        return True
+
+    def resolve_dependents(self, device, ok, checked_at):
+        """Разбирает отложенные и подавленные события после очередной проверки"""
+        if not ok and device.id in self.silenced and device.is_online is False \
+                and not device.parent_down and not self.parent_failing(device):
+            # Родитель доступен, а устройство - нет: это его собственный сбой
+            self.silenced.discard(device.id)
+            event_pipeline.emit(Event(EVENT_DOWN, device.id, device.ip, device.name, checked_at, False))
+
+        for child_id, held_at in list(self.held.items()):
+            child = self.devices.get(child_id)
+            if child is None or child.parent_id != device.id:
+                continue
+            if not ok:
+                del self.held[child_id]
+                self.silenced.add(child_id)
+                SUPPRESSED.inc("parent")
+            elif device.is_online:
+                del self.held[child_id]
+                event_pipeline.emit(Event(EVENT_DOWN, child.id, child.ip, child.name, held_at, False))
+
+    def parent_failing(self, device):
+        """Последняя проверка родителя неудачна, хотя сбой еще не подтвержден"""
+        parent = self.devices.get(device.parent_id) if device.parent_id else None
+        return parent is not None and parent.stats.last_lost
+
+    def recheck(self, device):
+        """Внеочередная проверка устройства, не чаще раза за RECHECK_DELAY"""
+        now = time.monotonic()
+        if now - self.rechecks.get(device.id, 0) < self.policy.recheck_delay:
+            return
+        self.rechecks[device.id] = now
+        if self.workers:
+            self.workers.assign(device, 0)
+        else:
+            self.engine.add(device, 0)
+
+    # --- Зависимости устройств ---
+
+    def ancestor_down(self, device):
+        """Недоступен ли один из вышестоящих узлов устройства"""
+        seen = {device.id}
+        parent = self.devices.get(device.parent_id) if device.parent_id else None
+        while parent is not None and parent.id not in seen:
+            if parent.is_online is False:
+                return True
+            seen.add(parent.id)
+            parent = self.devices.get(parent.parent_id) if parent.parent_id else None
+        return False
+
+    def descendants(self, device_id):
+        """Все устройства, зависящие от указанного напрямую или через другие"""
+        children = self._children
+        if children is None:
+            children = {}
+            for device in self.devices.values():
+                if device.parent_id:
+                    children.setdefault(device.parent_id, []).append(device)
+            self._children = children
+        found, queue, seen = [], [device_id], {device_id}
+        while queue:
+            for child in children.get(queue.pop(), []):
+                if child.id not in seen:
+                    seen.add(child.id)
+                    found.append(child)
+                    queue.append(child.id)
+        return found
+
+    def update_dependents(self, device, checked_at=None):
+        """Пересчитывает "недоступно через родителя" для зависимых устройств.
+
+        Пока родитель недоступен, зависимые проверяются с пониженной
+        частотой, а вместо сотен событий отправляется одно общее. После
+        восстановления родителя они перепроверяются в ближайшие секунды.
+        """
+        changed = []
+        for child in self.descendants(device.id):
+            parent_down = self.ancestor_down(child)
+            if parent_down == child.parent_down:
+                continue
+            child.parent_down = parent_down
+            changed.append(child.id)
+            if self.monitoring_status.get(child.id, False):
+                delay = None if parent_down else random.uniform(0, self.policy.recheck_delay)
+                if self.workers:
+                    self.workers.assign(child, delay)
+                else:
+                    self.engine.add(child, delay)
+            self.publish(child)
+        if checked_at is not None:
+            # При сбое перечисляются все зависимые, включая недоступные через
+            # другой узел, при восстановлении - те, что снова проверяются
+            dependents = changed if device.is_online else \
+                [child.id for child in self.descendants(device.id) if child.parent_down]
+            if dependents:
+                event_pipeline.emit(Event(
+                    EVENT_DEPENDENTS, device.id, device.ip, device.name, checked_at, device.is_online, dependents
+                ))
+        return changed
+
+    def set_parent(self, device, parent_id):
+        """Задает родителя устройства, не допуская ссылок на себя и циклов"""
+        parent_id = parent_id or None
+        if parent_id is not None:
+            if parent_id not in self.devices:
+                raise ValueError("Родительское устройство не найдено")
+            if parent_id == device.id or parent_id in {d.id for d in self.descendants(device.id)}:
+                raise ValueError("Зависимость образует цикл")
+        device.parent_id = parent_id
+        self._children = None
+
+    def refresh_dependency(self, device):
+        """Пересчитывает зависимость после смены родителя у устройства"""
+        parent_down = self.ancestor_down(device)
+        if parent_down != device.parent_down:
+            device.parent_down = parent_down
+            if self.engine and self.monitoring_status.get(device.id, False):
+                self.engine.add(device)
+        self.update_dependents(device)
+
+    def device_state(self, device):
+        """Текущее состояние устройства для клиентов дашборда"""
+        return {
+            "id": device.id,
+            "ip": device.ip,
+            "name": device.name,
+            "is_online": device.is_online,
+            "last_check": device.last_check,
+            "monitoring": self.monitoring_status.get(device.id, False),
+            "via_parent": device.parent_down
+        }
+
+    def publish(self, device):
+        device.version += 1
+        status_hub.publish(device.id, self.device_state(device))
 
     def add_device(self, device):
         # Сохраняем устройство в БД
         device.save()
         # Добавляем в кэш
         self.devices[device.id] = device
+        self._children = None
+        device.parent_down = self.ancestor_down(device)
+        self.publish(device)
         return device
 
+    def add_devices(self, devices):
+        """Массовое добавление устройств одной транзакцией"""
+        Device.save_many(devices)
+        for device in devices:
+            self.devices[device.id] = device
+        self._children = None
+        for device in devices:
+            device.parent_down = self.ancestor_down(device)
+            self.publish(device)
+        return devices
+
     def get_device(self, device_id):
-        # Сначала проверяем кэш
-        if device_id in self.devices:
-            return self.devices[device_id]
-        
-        # Если нет в кэше, ищем в БД
-        device = Device.get_by_id(device_id)
-        if device:
-            self.devices[device_id] = device
-        return device
+        return self.devices.get(device_id)
 
     def get_all_devices(self):
-        # Получаем все устройства из БД
-        devices_list = Device.get_all()
-        
-        # Обновляем кэш
-        for device in devices_list:
-            self.devices[device.id] = device
-            
-        # Возвращаем список устройств для совместимости с шаблоном
-        return devices_list
+        # Список устройств из реестра, без запроса к БД
+        return list(self.devices.values())
 
-    def update_device(self, device_id, ip=None, name=None, description=None):
+    def status_counts(self):
+        """Число доступных, недоступных и непроверенных устройств"""
+        counts = {"online_count": 0, "offline_count": 0, "unknown_count": 0}
+        for device in self.devices.values():
+            if device.is_online is None:
+                counts["unknown_count"] += 1
+            elif device.is_online:
+                counts["online_count"] += 1
+            else:
+                counts["offline_count"] += 1
+        return counts
+
+    def sync_devices(self):
+        """Сверяет реестр с БД, не заменяя живые объекты устройств.
+
+        Нужна только если таблицу devices меняли в обход монитора: новые
+        строки добавляются, изменённые поля переносятся в существующие
+        объекты (история и статистика сохраняются), удалённые убираются.
+        """
+        rows = {device.id: device for device in Device.get_all()}
+        for device_id in list(self.devices):
+            if device_id not in rows:
+                self.stop_monitoring(device_id)
+                status_writer.discard(device_id)
+                del self.devices[device_id]
+                status_hub.publish(device_id, None)
+        for device_id, fresh in rows.items():
+            device = self.devices.get(device_id)
+            if device is None:
+                self.devices[device_id] = fresh
+                self.publish(fresh)
+            elif (device.ip, device.name, device.description, device.tags, device.parent_id,
+                  device.check_type, device.check_target) != \
+                    (fresh.ip, fresh.name, fresh.description, fresh.tags, fresh.parent_id,
+                     fresh.check_type, fresh.check_target):
+                device.ip, device.name = fresh.ip, fresh.name
+                device.description, device.tags = fresh.description, fresh.tags
+                device.parent_id = fresh.parent_id
+                device.check_type, device.check_target = fresh.check_type, fresh.check_target
+                self.publish(device)
+        self._children = None
+        for device in self.devices.values():
+            device.parent_down = self.ancestor_down(device)
+        return len(self.devices)
+
+    def update_device(self, device_id, ip=None, name=None, description=None, tags=None, check_interval=None,
+                      parent_id=None, check_type=None, check_target=None):
         device = self.get_device(device_id)
         if not device:
             return None
 
+        # None - оставить вид проверки как есть; ICMP после проверки тоже None
+        check_changed = check_type is not None
+        if check_changed:
+            check_type, check_target = validate_check(check_type, check_target)
+        # None - оставить интервал, 0 - вернуться к интервалу по тегам или общему
+        interval_changed = check_interval is not None
+        if interval_changed:
+            check_interval = validate_interval(check_interval)
+
+        # Пустая строка убирает родителя, None - оставляет как есть
+        parent_changed = parent_id is not None and (parent_id or None) != device.parent_id
+        if parent_changed:
+            self.set_parent(device, parent_id)
+
         if ip:
             device.ip = ip
         if name:
             device.name = name
         if description is not None:
             device.description = description
+        if tags is not None:
+            device.tags = parse_tags(tags)
+        if interval_changed:
+            device.check_interval = check_interval
+        if check_changed:
+            device.check_type, device.check_target = check_type, check_target
 
         # Сохраняем изменения в БД
         device.save()
+        if parent_changed:
+            self.refresh_dependency(device)
+        self.publish(device)
+        # Воркеры работают с копией параметров устройства - обновляем её
+        if self.workers and self.monitoring_status.get(device_id, False):
+            self.workers.assign(device)
         return device
 
     def delete_device(self, device_id):
@@ -146,16 +458,31 @@ class DeviceMonitor:
         if self.monitoring_status.get(device_id, False):
             self.stop_monitoring(device_id)
         
-        # Удаляем устройство из БД
+        # Удаляем устройство и его историю из БД
+        status_writer.discard(device_id)
         device.delete()
+        history.delete_device(device_id)
         
         # Удаляем из кэша
         if device_id in self.devices:
             del self.devices[device_id]
+        self._children = None
+        status_hub.publish(device_id, None)
+        self.monitoring_status.pop(device_id, None)
+        self.silenced.discard(device_id)
+        self.held.pop(device_id, None)
+
+        # Зависимые устройства остаются без родителя
+        for child in [d for d in self.devices.values() if d.parent_id == device_id]:
+            child.parent_id = None
+            self._children = None
+            child.save()
+            self.refresh_dependency(child)
+            self.publish(child)
             
         return True
 
-    def start_monitoring(self, device_id):
+    def start_monitoring(self, device_id, delay=None):
         if device_id not in self.devices:
             return False
         
@@ -163,29 +490,60 @@ class DeviceMonitor:
             return True  # Уже запущен
         
         self.monitoring_status[device_id] = True
-        thread = threading.Thread(target=self.monitor_device, args=(device_id,))
-        thread.daemon = True
-        thread.start()
-        self.monitoring_threads[device_id] = thread
+        device = self.devices[device_id]
+        # Флаг мониторинга сохраняется, чтобы возобновить его после перезапуска
+        device.monitoring = True
+        status_writer.submit(device.to_db_row())
+        if delay is None:
+            # Первый запуск смещается случайно в пределах интервала устройства
+            delay = random.uniform(0, self.policy.interval_for(device))
+        if self.workers:
+            self.workers.assign(device, delay)
+        else:
+            self.engine.add(device, delay)
+        self.publish(self.devices[device_id])
         return True
 
     def stop_monitoring(self, device_id):
         if device_id not in self.devices:
             return False
         
-        # Устанавливаем флаг остановки
+        # Снимаем устройство с расписания, уже идущая проверка завершится сама
         self.monitoring_status[device_id] = False
-        
-        # Ждем завершения потока (максимум 2 секунды)
-        if device_id in self.monitoring_threads:
-            thread = self.monitoring_threads[device_id]
-            if thread and thread.is_alive():
-                thread.join(timeout=2)
-                # Удаляем поток из словаря
-                del self.monitoring_threads[device_id]
-                
+        device = self.devices[device_id]
+        if device.monitoring:
+            device.monitoring = False
+            device.next_check = None
+            status_writer.submit(device.to_db_row())
+        if self.workers:
+            self.workers.unassign(device_id)
+        else:
+            self.engine.remove(device_id)
+        self.publish(self.devices[device_id])
         return True
 
+    def select_devices(self, ids=None, tag=None):
+        """Возвращает ID устройств из списка и/или с указанным тегом"""
+        selected = [device_id for device_id in (ids or []) if device_id in self.devices]
+        if tag:
+            selected.extend(device.id for device in self.devices.values() if tag in device.tags)
+        return list(dict.fromkeys(selected))
+
+    def filter_devices(self, status=None, tag=None, query=None, monitoring=None):
+        """Фильтрует устройства по статусу, тегу, подстроке IP/имени и флагу мониторинга"""
+        states = {"online": True, "offline": False, "unknown": None}
+        query = query.lower() if query else None
+        for device in self.devices.values():
+            if status is not None and device.is_online is not states[status]:
+                continue
+            if tag and tag not in device.tags:
+                continue
+            if query and query not in device.ip.lower() and query not in device.name.lower():
+                continue
+            if monitoring is not None and self.monitoring_status.get(device.id, False) != monitoring:
+                continue
+            yield device
+
     def start_all_monitoring(self):
         for device_id in self.devices:
             self.start_monitoring(device_id)
@@ -196,5 +554,12 @@ class DeviceMonitor:
             self.stop_monitoring(device_id)
         return True
 
+    def shutdown(self):
+        """Останавливает проверки в этом процессе или пул воркеров"""
+        if self.workers:
+            self.workers.stop()
+        elif self.engine:
+            self.engine.shutdown()
+
 # Создаем глобальный экземпляр монитора
 device_monitor = DeviceMonitor()
\ No newline at end of file
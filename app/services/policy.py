@@ -0,0 +1,135 @@
+import math
+import os
+
+# Минимальный интервал проверки устройства в секундах
+MIN_CHECK_INTERVAL = float(os.getenv("MIN_CHECK_INTERVAL", "1"))
+
+
+def validate_interval(value):
+    """Проверяет интервал устройства; 0 или пустое значение - интервал по умолчанию (None)"""
+    if value in (None, ""):
+        return None
+    try:
+        interval = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Некорректный интервал проверки: {value}")
+    if not math.isfinite(interval):
+        raise ValueError(f"Некорректный интервал проверки: {value}")
+    if interval == 0:
+        return None
+    if interval < MIN_CHECK_INTERVAL:
+        raise ValueError(f"Интервал проверки должен быть не меньше {MIN_CHECK_INTERVAL:g} с")
+    return interval
+
+
+def parse_tag_intervals(value):
+    """Разбирает строку вида "core=2,edge=30" в словарь {тег: интервал}"""
+    intervals = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        tag, interval = item.split("=", 1)
+        try:
+            interval = validate_interval(interval.strip())
+        except ValueError as e:
+            raise ValueError(f"TAG_INTERVALS, тег {tag.strip()}: {e}")
+        if interval is None:
+            raise ValueError(f"TAG_INTERVALS, тег {tag.strip()}: не указан интервал")
+        intervals[tag.strip()] = interval
+    return intervals
+
+
+class ProbeState:
+    """Состояние расписания одного устройства"""
+
+    __slots__ = ("confirmed", "votes", "down_probes")
+
+    def __init__(self, confirmed=None):
+        # Подтвержденный статус устройства
+        self.confirmed = confirmed
+        # Результаты проверок, пока смена статуса не подтверждена
+        self.votes = []
+        # Число проверок подряд в подтвержденном состоянии "недоступен"
+        self.down_probes = 0
+
+
+class ProbePolicy:
+    """Адаптивное расписание проверок.
+
+    - интервал задается для устройства, для его тегов или глобально;
+    - давно недоступные устройства проверяются все реже (экспоненциально);
+    - подозрение на смену статуса сразу перепроверяется, и статус меняется
+      только если N из M проверок подряд с ним согласны.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or float(os.getenv("CHECK_INTERVAL", "5"))
+        self.tag_intervals = parse_tag_intervals(os.getenv("TAG_INTERVALS", ""))
+        self.backoff_after = int(os.getenv("BACKOFF_AFTER", "12"))
+        self.backoff_max = float(os.getenv("BACKOFF_MAX_INTERVAL", "300"))
+        self.confirm_needed = int(os.getenv("CONFIRM_NEEDED", "2"))
+        self.confirm_window = int(os.getenv("CONFIRM_WINDOW", "3"))
+        self.recheck_delay = float(os.getenv("RECHECK_DELAY", "1"))
+        self.dependent_interval = float(os.getenv("DEPENDENT_INTERVAL", "60"))
+        self.states = {}
+
+    def interval_for(self, device):
+        """Базовый интервал устройства: свой, по тегам (минимальный) или общий.
+
+        Пока недоступен вышестоящий узел, устройство проверяется не чаще
+        чем раз в dependent_interval.
+        """
+        if getattr(device, "check_interval", None):
+            interval = device.check_interval
+        else:
+            tagged = [self.tag_intervals[tag] for tag in device.tags if tag in self.tag_intervals]
+            interval = min(tagged) if tagged else self.interval
+        # Интервалы, сохраненные до проверки при вводе, не дают частить
+        interval = max(interval, MIN_CHECK_INTERVAL)
+        if getattr(device, "parent_down", False):
+            return max(interval, self.dependent_interval)
+        return interval
+
+    def state_for(self, device):
+        state = self.states.get(device.id)
+        if state is None:
+            state = self.states[device.id] = ProbeState(device.is_online)
+        return state
+
+    def forget(self, device_id):
+        self.states.pop(device_id, None)
+
+    def update(self, device, ok):
+        """Учитывает результат проверки.
+
+        Возвращает (подтвержденный статус, задержка до следующей проверки).
+        """
+        state = self.state_for(device)
+        interval = self.interval_for(device)
+
+        if state.confirmed is None:
+            # Первая проверка задает начальный статус без подтверждения
+            state.confirmed = ok
+        elif state.votes or ok != state.confirmed:
+            state.votes.append(ok)
+            against = sum(1 for vote in state.votes if vote != state.confirmed)
+            if against >= self.confirm_needed:
+                # Смена статуса подтверждена
+                state.confirmed = not state.confirmed
+                state.votes = []
+                state.down_probes = 0
+            elif len(state.votes) - against > self.confirm_window - self.confirm_needed:
+                # Набрать N из M уже невозможно - это был кратковременный сбой
+                state.votes = []
+            else:
+                return state.confirmed, self.recheck_delay
+
+        if state.confirmed:
+            state.down_probes = 0
+            return state.confirmed, interval
+
+        state.down_probes += 1
+        if state.down_probes <= self.backoff_after:
+            return state.confirmed, interval
+        backoff = interval * 2 ** min(state.down_probes - self.backoff_after, 16)
+        return state.confirmed, min(backoff, max(self.backoff_max, interval))
@@ -0,0 +1,363 @@
+import asyncio
+import itertools
+import os
+import platform
+import random
+import re
+import socket
+import struct
+import sys
+import time
+from collections import namedtuple
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP_DEST_UNREACHABLE = 3
+ICMP_TIME_EXCEEDED = 11
+ICMP_RECV_BUFFER = 1 << 20
+
+# Виды ошибок проверки
+ERROR_TIMEOUT = "timeout"
+ERROR_UNREACHABLE = "unreachable"
+ERROR_RESOLVE = "resolve"
+ERROR_SEND = "send"
+ERROR_PROCESS = "process"
+ERROR_REFUSED = "refused"
+ERROR_HTTP = "http"
+ERROR_DNS = "dns"
+
+# Результат одной проверки: ok - доступность, rtt - время отклика в
+# миллисекундах, ttl - TTL ответа, error - вид ошибки или None
+ProbeResult = namedtuple("ProbeResult", "ok rtt ttl error")
+
+
+# Компактные коды статуса для хранения истории
+STATUS_CODES = {
+    None: 1,
+    ERROR_TIMEOUT: 0,
+    ERROR_UNREACHABLE: 2,
+    ERROR_RESOLVE: 3,
+    ERROR_SEND: 4,
+    ERROR_PROCESS: 5,
+    ERROR_REFUSED: 6,
+    ERROR_HTTP: 7,
+    ERROR_DNS: 8,
+}
+
+
+def failed(error):
+    return ProbeResult(False, None, None, error)
+
+
+def status_code(result):
+    return 1 if result.ok else STATUS_CODES.get(result.error, 0)
+
+
+_ERRORS_BY_CODE = {code: error for error, code in STATUS_CODES.items()}
+
+
+def result_from_status(code, rtt=None):
+    """Восстанавливает ProbeResult из сохраненного кода статуса"""
+    if code == 1:
+        return ProbeResult(True, rtt, None, None)
+    return failed(_ERRORS_BY_CODE.get(code, ERROR_TIMEOUT))
+
+
+_RTT_PATTERN = re.compile(r"(?:time|время)[=<]\s*([\d.,]+)", re.IGNORECASE)
+_TTL_PATTERN = re.compile(r"ttl=(\d+)", re.IGNORECASE)
+
+
+class SubprocessProber:
+    """Проверка доступности через системную утилиту ping.
+
+    Используется как запасной вариант, когда ICMP-сокет открыть нельзя.
+    """
+
+    name = "subprocess"
+
+    def __init__(self):
+        self.is_windows = platform.system().lower() == "windows"
+
+    def _command(self, ip, timeout):
+        if self.is_windows:
+            # Для Windows таймаут указывается в миллисекундах
+            return ["ping", "-n", "1", "-w", str(int(timeout * 1000)), ip]
+        # Для Linux/Mac таймаут указывается в секундах
+        return ["ping", "-c", "1", "-W", str(timeout), ip]
+
+    async def ping(self, ip, timeout):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self._command(ip, timeout),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+        except OSError:
+            return failed(ERROR_PROCESS)
+
+        try:
+            # Общий таймаут процесса
+            output, _ = await asyncio.wait_for(process.communicate(), timeout * 2)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return failed(ERROR_TIMEOUT)
+
+        # В Windows вывод ping в кодировке cp866
+        text = output.decode("cp866" if self.is_windows else "utf-8", errors="replace")
+        return self.parse_output(process.returncode, text)
+
+    @staticmethod
+    def parse_output(returncode, text):
+        """Разбирает вывод ping: TTL, время отклика или вид ошибки"""
+        ttl = _TTL_PATTERN.search(text)
+        if returncode != 0 or not ttl:
+            if "unreachable" in text.lower() or "недоступ" in text.lower():
+                return failed(ERROR_UNREACHABLE)
+            return failed(ERROR_TIMEOUT)
+        rtt = _RTT_PATTERN.search(text)
+        rtt = float(rtt.group(1).replace(",", ".")) if rtt else None
+        return ProbeResult(True, rtt, int(ttl.group(1)), None)
+
+    def close(self):
+        pass
+
+
+def _checksum(data):
+    """Контрольная сумма ICMP (RFC 1071)"""
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _open_icmp_socket():
+    """Открывает ICMP-сокет: сначала непривилегированный, затем raw.
+
+    Возвращает (socket, is_raw) или бросает OSError.
+    """
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        is_raw = False
+    except OSError:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        is_raw = True
+    # Увеличенный буфер приема, чтобы пачка ответов не терялась
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, ICMP_RECV_BUFFER)
+    if not is_raw and hasattr(socket, "IP_RECVTTL"):
+        # Непривилегированный сокет отдает TTL только во вспомогательных данных
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_RECVTTL, 1)
+    sock.setblocking(False)
+    return sock, is_raw
+
+
+class IcmpProber:
+    """Проверка доступности через собственный ICMP-сокет без запуска процессов.
+
+    Все эхо-запросы отправляются через один сокет, ответы сопоставляются с
+    ожидающими запросами по идентификатору и порядковому номеру.
+    """
+
+    name = "icmp"
+
+    def __init__(self):
+        self.identifier = os.getpid() & 0xFFFF
+        self._sequence = itertools.count(1)
+        self._pending = {}
+        self._sock = None
+        self._is_raw = False
+        self._loop = None
+
+    @staticmethod
+    def is_available():
+        # loop.sock_sendto появился в Python 3.11
+        if sys.version_info < (3, 11):
+            return False
+        try:
+            sock, _ = _open_icmp_socket()
+        except OSError:
+            return False
+        sock.close()
+        return True
+
+    def _ensure_socket(self, loop):
+        if self._sock is not None and self._loop is loop:
+            return
+        self.close()
+        self._sock, self._is_raw = _open_icmp_socket()
+        self._loop = loop
+        loop.add_reader(self._sock.fileno(), self._on_readable)
+
+    def _next_sequence(self):
+        # Номер занимает 16 бит, пропускаем номера ещё ожидающих запросов
+        while True:
+            seq = next(self._sequence) & 0xFFFF
+            if seq and seq not in self._pending:
+                return seq
+
+    def _build_packet(self, seq):
+        payload = b"\x00" * 32
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, self.identifier, seq)
+        checksum = _checksum(header + payload)
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, self.identifier, seq)
+        return header + payload
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, ancdata, _, address = self._sock.recvmsg(2048, 64)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            received = time.perf_counter()
+            ttl = None
+            for level, kind, value in ancdata:
+                if level == socket.IPPROTO_IP and kind == getattr(socket, "IP_TTL", None):
+                    ttl = struct.unpack("=i", value[:4])[0] if len(value) >= 4 else value[0]
+            self._handle_packet(data, address[0], ttl, received)
+
+    def _handle_packet(self, data, source, ttl, received):
+        if self._is_raw:
+            # raw-сокет возвращает пакет вместе с IP-заголовком
+            ttl = data[8]
+            data = data[(data[0] & 0x0F) * 4:]
+        if len(data) < 8:
+            return
+        icmp_type, _, _, identifier, seq = struct.unpack("!BBHHH", data[:8])
+
+        if icmp_type in (ICMP_DEST_UNREACHABLE, ICMP_TIME_EXCEEDED) and self._is_raw:
+            # В сообщении об ошибке вложен заголовок нашего исходного запроса
+            inner = data[8:]
+            inner = inner[(inner[0] & 0x0F) * 4:] if inner else b""
+            if len(inner) < 8:
+                return
+            _, _, _, identifier, seq = struct.unpack("!BBHHH", inner[:8])
+            result = failed(ERROR_UNREACHABLE)
+            source = None
+        elif icmp_type == ICMP_ECHO_REPLY:
+            result = None
+        else:
+            return
+
+        # Для непривилегированного сокета идентификатор подставляет ядро,
+        # поэтому он проверяется только для raw-сокета
+        if self._is_raw and identifier != self.identifier:
+            return
+        pending = self._pending.get(seq)
+        if pending is None:
+            return
+        address, sent, future = pending
+        if future.done() or (source is not None and address != source):
+            return
+        if result is None:
+            result = ProbeResult(True, round((received - sent) * 1000, 3), ttl, None)
+        future.set_result(result)
+
+    async def _resolve(self, loop, host):
+        try:
+            socket.inet_aton(host)
+            return host
+        except OSError:
+            pass
+        infos = await loop.getaddrinfo(host, None, family=socket.AF_INET)
+        return infos[0][4][0]
+
+    async def ping(self, ip, timeout):
+        loop = asyncio.get_running_loop()
+        self._ensure_socket(loop)
+        try:
+            address = await self._resolve(loop, ip)
+        except (OSError, IndexError):
+            return failed(ERROR_RESOLVE)
+
+        seq = self._next_sequence()
+        future = loop.create_future()
+        self._pending[seq] = (address, time.perf_counter(), future)
+        try:
+            await loop.sock_sendto(self._sock, self._build_packet(seq), (address, 0))
+        except OSError:
+            self._pending.pop(seq, None)
+            return failed(ERROR_SEND)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return failed(ERROR_TIMEOUT)
+        finally:
+            self._pending.pop(seq, None)
+
+    def close(self):
+        if self._sock is None:
+            return
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        self._loop = None
+
+
+class SimulatedProber:
+    """Детерминированная имитация сети для нагрузочных тестов.
+
+    У каждого адреса свой генератор случайных чисел, зависящий от SIM_SEED
+    и адреса, поэтому при одинаковых настройках прогоны повторяются.
+    Задержка ответа - SIM_LATENCY_MS +- SIM_JITTER_MS, доля потерь -
+    SIM_LOSS, вероятность смены доступности устройства на каждой
+    проверке - SIM_FLAP. Потерянная проверка ждет полный таймаут.
+    Имитирует и проверки сервисов (TCP, HTTP, DNS).
+    """
+
+    name = "simulated"
+
+    def __init__(self, latency=None, jitter=None, loss=None, flap=None, seed=None):
+        self.latency = latency if latency is not None else float(os.getenv("SIM_LATENCY_MS", "20"))
+        self.jitter = jitter if jitter is not None else float(os.getenv("SIM_JITTER_MS", "5"))
+        self.loss = loss if loss is not None else float(os.getenv("SIM_LOSS", "0.01"))
+        self.flap = flap if flap is not None else float(os.getenv("SIM_FLAP", "0.001"))
+        self.seed = seed if seed is not None else int(os.getenv("SIM_SEED", "0"))
+        # адрес -> [генератор, доступно ли устройство]
+        self._hosts = {}
+
+    def _host(self, ip):
+        host = self._hosts.get(ip)
+        if host is None:
+            rng = random.Random(f"{self.seed}:{ip}")
+            host = self._hosts[ip] = [rng, True]
+        return host
+
+    async def ping(self, ip, timeout):
+        host = self._host(ip)
+        rng = host[0]
+        if rng.random() < self.flap:
+            host[1] = not host[1]
+        if not host[1] or rng.random() < self.loss:
+            await asyncio.sleep(timeout)
+            return failed(ERROR_TIMEOUT)
+        rtt = max(0.0, rng.uniform(self.latency - self.jitter, self.latency + self.jitter))
+        if rtt >= timeout * 1000:
+            await asyncio.sleep(timeout)
+            return failed(ERROR_TIMEOUT)
+        await asyncio.sleep(rtt / 1000)
+        return ProbeResult(True, round(rtt, 3), 64, None)
+
+    def close(self):
+        pass
+
+
+PROBERS = {
+    "icmp": IcmpProber,
+    "subprocess": SubprocessProber,
+    "simulated": SimulatedProber,
+}
+
+
+def create_prober(name=None):
+    """Создает бэкенд проверок по имени из PROBER (auto, icmp, subprocess, simulated)"""
+    name = (name or os.getenv("PROBER", "auto")).lower()
+    if name == "auto":
+        name = "icmp" if IcmpProber.is_available() else "subprocess"
+    if name not in PROBERS:
+        raise ValueError(f"Неизвестный тип проверки: {name}")
+    return PROBERS[name]()
@@ -0,0 +1,172 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from app.services.metrics import SCHEDULER_LATENESS
+
+
+class ProbeScheduler:
+    """Единый asyncio-планировщик проверок для всех устройств.
+
+    Все проверки живут в одной куче, упорядоченной по времени следующего
+    запуска, и выполняются в одном фоновом потоке с собственным event loop.
+    Число одновременных проверок ограничено семафором, а общая частота
+    проверок - бюджетом rate проверок в секунду (0 - без ограничения).
+    """
+
+    def __init__(self, check, interval, max_concurrency=100, jitter=True, rate=0):
+        # check - корутина check(device_id), возвращающая задержку до
+        # следующей проверки в секундах или None для интервала по умолчанию
+        self.check = check
+        self.interval = interval
+        self.max_concurrency = max_concurrency
+        self.jitter = jitter
+        self.rate = rate
+        self._budget = float(rate)
+        self._budget_time = time.monotonic()
+
+        self._heap = []
+        self._tokens = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+        self._loop = None
+        self._thread = None
+        self._wakeup = None
+        self._ready = threading.Event()
+
+    # --- Управление потоком планировщика ---
+
+    def start(self):
+        """Запускает поток планировщика, если он ещё не запущен"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="probe-scheduler")
+        self._thread.daemon = True
+        self._thread.start()
+        self._ready.wait()
+
+    def shutdown(self):
+        """Останавливает планировщик и снимает все устройства с расписания"""
+        with self._lock:
+            self._tokens.clear()
+            self._heap.clear()
+        if self._loop and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=2)
+        self._thread = None
+        self._loop = None
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._loop.create_task(self._dispatch())
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            # Отменяем незавершённые проверки перед закрытием цикла
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+
+    # --- Расписание ---
+
+    def schedule(self, device_id, delay=None):
+        """Ставит устройство на расписание.
+
+        Без явной задержки первый запуск смещается на случайную величину в
+        пределах интервала, чтобы устройства не проверялись одновременно.
+        """
+        if delay is None:
+            delay = random.uniform(0, self.interval) if self.jitter else 0
+        self.start()
+        token = next(self._counter)
+        with self._lock:
+            self._tokens[device_id] = token
+            heapq.heappush(self._heap, (time.monotonic() + delay, token, device_id))
+        self._notify()
+
+    def cancel(self, device_id):
+        """Снимает устройство с расписания за O(1).
+
+        Запись в куче остаётся и отбрасывается при извлечении, так как её
+        токен больше не совпадает с актуальным.
+        """
+        with self._lock:
+            return self._tokens.pop(device_id, None) is not None
+
+    def _notify(self):
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _pop_due(self, now):
+        """Извлекает из кучи все записи, время которых наступило"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, token, device_id = heapq.heappop(self._heap)
+                if self._tokens.get(device_id) == token:
+                    due.append((when, token, device_id))
+            next_due = self._heap[0][0] if self._heap else None
+        return due, next_due
+
+    async def _dispatch(self):
+        while True:
+            due, next_due = self._pop_due(time.monotonic())
+            for when, token, device_id in due:
+                self._loop.create_task(self._run_check(when, token, device_id))
+
+            self._wakeup.clear()
+            timeout = None if next_due is None else max(0.0, next_due - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _take_budget(self):
+        """Ждет свободную проверку в бюджете (token bucket с запасом на 1 секунду)"""
+        while True:
+            now = time.monotonic()
+            # Запас не меньше одной проверки, иначе дробный rate (доля воркера) не пропустит ни одной
+            capacity = max(self.rate, 1)
+            self._budget = min(capacity, self._budget + (now - self._budget_time) * self.rate)
+            self._budget_time = now
+            if self._budget >= 1:
+                self._budget -= 1
+                return
+            await asyncio.sleep((1 - self._budget) / self.rate)
+
+    async def _run_check(self, when, token, device_id):
+        delay = None
+        try:
+            if self.rate:
+                await self._take_budget()
+            async with self._semaphore:
+                if self._tokens.get(device_id) != token:
+                    return
+                SCHEDULER_LATENESS.observe(max(0.0, time.monotonic() - when))
+                delay = await self.check(device_id)
+        except Exception as e:
+            print(f"Ошибка проверки устройства {device_id}: {e}")
+
+        if delay is None:
+            delay = self.interval
+
+        # Следующий запуск считается от запланированного времени, а не от
+        # фактического, чтобы расписание не "уплывало"
+        next_when = max(when + delay, time.monotonic())
+        with self._lock:
+            if self._tokens.get(device_id) != token:
+                return
+            heapq.heappush(self._heap, (next_when, token, device_id))
+        self._wakeup.set()
@@ -0,0 +1,214 @@
+import bisect
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from app.services.engine import ProbeEngine, Target
+from app.services.metrics import registry
+from app.services.prober import ProbeResult
+
+# Как часто воркер отправляет накопленные результаты в основной процесс
+RESULT_FLUSH_INTERVAL = 0.1
+# Как часто воркер отправляет снимок своих метрик
+METRICS_INTERVAL = 1.0
+
+
+class HashRing:
+    """Консистентное хеширование устройств по воркерам.
+
+    При изменении числа воркеров переезжает только небольшая доля устройств.
+    """
+
+    def __init__(self, nodes, replicas=64):
+        self.nodes = list(nodes)
+        self._ring = sorted(
+            (self._hash(f"{node}:{replica}"), node)
+            for node in self.nodes
+            for replica in range(replicas)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def node_for(self, key):
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+def worker_main(index, commands, results, rate=0):
+    """Точка входа процесса-воркера: свой планировщик и бэкенд проверок.
+
+    rate - доля общего MAX_PROBES_PER_SECOND, приходящаяся на этот воркер.
+    """
+    pending = []
+    lock = threading.Lock()
+    # Процесс мог унаследовать значения метрик родителя
+    registry.reset()
+
+    def report(device_id, checked_at, result, confirmed, next_check):
+        with lock:
+            pending.append((device_id, checked_at, tuple(result), confirmed, next_check))
+
+    engine = ProbeEngine(report, rate=rate)
+    metrics_sent = 0
+    try:
+        while True:
+            try:
+                command = commands.get(timeout=RESULT_FLUSH_INTERVAL)
+            except queue.Empty:
+                command = None
+
+            if command is not None:
+                action, payload = command
+                if action == "add":
+                    target, delay = payload
+                    engine.add(Target(*target), delay)
+                elif action == "remove":
+                    engine.remove(payload)
+                elif action == "stop":
+                    break
+
+            with lock:
+                batch, pending[:] = pending[:], []
+            snapshot = None
+            if time.monotonic() - metrics_sent >= METRICS_INTERVAL:
+                snapshot = registry.snapshot()
+                metrics_sent = time.monotonic()
+            if batch or snapshot:
+                results.put((index, batch, snapshot))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.shutdown()
+
+
+class WorkerPool:
+    """Пул процессов-воркеров, между которыми распределяются устройства.
+
+    Каждый воркер запускает собственный ProbeEngine, общий бюджет
+    MAX_PROBES_PER_SECOND делится между воркерами поровну. Результаты пачками
+    возвращаются через общую очередь и передаются в report основного
+    процесса из отдельного потока.
+    """
+
+    def __init__(self, size, report):
+        self.size = size
+        self.report = report
+        self.rate = float(os.getenv("MAX_PROBES_PER_SECOND", "0"))
+        self._context = multiprocessing.get_context()
+        self.results = self._context.Queue()
+        self.workers = {}
+        self.ring = HashRing(range(size))
+        # device_id -> (номер воркера, описание устройства)
+        self.assignments = {}
+        # Последние снимки метрик каждого воркера
+        self.metrics = {}
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopped.clear()
+        for index in range(self.size):
+            self._spawn(index)
+        for target, name in ((self._read_results, "worker-results"), (self._supervise, "worker-supervisor")):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _spawn(self, index):
+        commands = self._context.Queue()
+        process = self._context.Process(
+            target=worker_main, args=(index, commands, self.results, self.worker_rate()),
+            name=f"probe-worker-{index}",
+        )
+        process.daemon = True
+        process.start()
+        self.workers[index] = (process, commands)
+
+    def worker_rate(self):
+        """Бюджет проверок в секунду одного воркера (0 - без ограничения)"""
+        return self.rate / self.size if self.size else 0
+
+    def _send(self, index, action, payload=None):
+        self.workers[index][1].put((action, payload))
+
+    def assign(self, device, delay=None):
+        """Отправляет устройство воркеру-владельцу (или обновляет его параметры)"""
+        self.start()
+        target = Target.from_device(device).to_tuple()
+        with self._lock:
+            owner = self.ring.node_for(device.id)
+            previous = self.assignments.get(device.id)
+            if previous and previous[0] != owner:
+                self._send(previous[0], "remove", device.id)
+            self.assignments[device.id] = (owner, target)
+            self._send(owner, "add", (target, delay))
+
+    def unassign(self, device_id):
+        with self._lock:
+            previous = self.assignments.pop(device_id, None)
+            if previous:
+                self._send(previous[0], "remove", device_id)
+
+    def _read_results(self):
+        while not self._stopped.is_set():
+            try:
+                index, batch, snapshot = self.results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if snapshot:
+                self.metrics[index] = snapshot
+            for device_id, checked_at, result, confirmed, next_check in batch:
+                # Результат от воркера, который уже не владеет устройством, отбрасываем
+                assignment = self.assignments.get(device_id)
+                if assignment is None or assignment[0] != index:
+                    continue
+                try:
+                    self.report(device_id, checked_at, ProbeResult(*result), confirmed, next_check)
+                except Exception as e:
+                    print(f"Ошибка обработки результата {device_id}: {e}")
+
+    def _supervise(self):
+        """Перезапускает упавшие воркеры и заново раздает им устройства"""
+        while not self._stopped.wait(2):
+            with self._lock:
+                for index, (process, _) in list(self.workers.items()):
+                    if process.is_alive():
+                        continue
+                    print(f"Воркер {index} завершился, перезапуск")
+                    self._spawn(index)
+                    for device_id, (owner, target) in self.assignments.items():
+                        if owner == index:
+                            self._send(index, "add", (target, None))
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            for process, commands in self.workers.values():
+                commands.put(("stop", None))
+            for process, _ in self.workers.values():
+                process.join(timeout=2)
+                if process.is_alive():
+                    process.terminate()
+            self.workers.clear()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+
+    def counts(self):
+        """Число устройств на каждом воркере"""
+        counts = dict.fromkeys(self.workers, 0)
+        for index, _ in list(self.assignments.values()):
+            counts[index] = counts.get(index, 0) + 1
+        return counts
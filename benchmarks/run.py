@@ -0,0 +1,245 @@
+"""Нагрузочный прогон монитора на имитированной сети.
+
+Создает временную БД с заданным числом устройств, запускает мониторинг
+с бэкендом проверок simulated (см. SimulatedProber) и в это же время
+опрашивает маршруты приложения прямыми ASGI-вызовами. Сеть и сервер не
+нужны, поэтому результаты разных версий можно сравнивать на ноутбуке.
+
+    python -m benchmarks.run --devices 1000 --duration 30
+    python -m benchmarks.run --devices 10000 --interval 10 --workers 4 --json result.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+API_PATHS = ("/api/status?limit=100", "/metrics", "/device_results/{id}", "/")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон монитора на имитированной сети")
+    parser.add_argument("--devices", type=int, default=1000, help="число устройств")
+    parser.add_argument("--duration", type=float, default=20, help="длительность замера в секундах")
+    parser.add_argument("--interval", type=int, default=5, help="интервал проверки устройства")
+    parser.add_argument("--timeout", type=float, default=0.5, help="таймаут проверки")
+    parser.add_argument("--workers", type=int, default=0, help="число процессов-воркеров")
+    parser.add_argument("--concurrency", type=int, default=1000, help="максимум одновременных проверок")
+    parser.add_argument("--latency", type=float, default=20, help="средняя задержка ответа, мс")
+    parser.add_argument("--jitter", type=float, default=5, help="разброс задержки, мс")
+    parser.add_argument("--loss", type=float, default=0.01, help="доля потерянных проверок")
+    parser.add_argument("--flap", type=float, default=0.001, help="вероятность смены доступности на проверке")
+    parser.add_argument("--seed", type=int, default=0, help="зерно генератора имитации")
+    parser.add_argument("--json", help="сохранить результаты в файл для сравнения версий")
+    return parser.parse_args()
+
+
+def configure(args, directory):
+    """Настройки окружения задаются до импорта приложения"""
+    os.environ.update({
+        "DATABASE_URL": "sqlite:///" + os.path.join(directory, "bench.db"),
+        "PROBER": "simulated",
+        "CHECK_INTERVAL": str(args.interval),
+        "PING_TIMEOUT": str(args.timeout),
+        "MONITOR_WORKERS": str(args.workers),
+        "MAX_CONCURRENT_PROBES": str(args.concurrency),
+        "AUTO_RESUME": "0",
+        "SIM_LATENCY_MS": str(args.latency),
+        "SIM_JITTER_MS": str(args.jitter),
+        "SIM_LOSS": str(args.loss),
+        "SIM_FLAP": str(args.flap),
+        "SIM_SEED": str(args.seed),
+    })
+
+
+async def asgi_get(app, path):
+    """GET-запрос к ASGI-приложению без сети, возвращает код ответа"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def api_load(app, paths, duration):
+    """Последовательно опрашивает маршруты, возвращает задержки по каждому"""
+    latencies = {path: [] for path in paths}
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for path, url in paths.items():
+            started = time.perf_counter()
+            status = await asgi_get(app, url)
+            latencies[path].append(time.perf_counter() - started)
+            if status != 200:
+                raise RuntimeError(f"{url}: код ответа {status}")
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def histogram_delta(before, after):
+    """Разница гистограмм: (число наблюдений, сумма, счетчики корзин)"""
+    counts, total = None, 0.0
+    for key, row in after.items():
+        previous = before.get(key)
+        diff = [a - b for a, b in zip(row, previous)] if previous else list(row)
+        counts = diff[:-1] if counts is None else [a + b for a, b in zip(counts, diff[:-1])]
+        total += diff[-1]
+    if counts is None:
+        return 0, 0.0, []
+    return sum(counts), total, counts
+
+
+def histogram_quantile(buckets, counts, q):
+    """Верхняя граница корзины, в которую попадает квантиль q"""
+    total = sum(counts)
+    if not total:
+        return None
+    seen = 0
+    for bound, count in zip(tuple(buckets) + (float("inf"),), counts):
+        seen += count
+        if seen >= total * q:
+            return bound
+    return float("inf")
+
+
+def counter_delta(before, after):
+    return sum(after.values()) - sum(before.values())
+
+
+def ms(value):
+    return None if value is None else round(value * 1000, 3)
+
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp(prefix="netmon-bench-")
+    configure(args, directory)
+    # Шаблоны и статика приложения ищутся относительно корня проекта
+    os.chdir(ROOT)
+
+    from app import create_app
+    from app.database import db, history, status_writer
+    from app.models.device import Device, STATS_WINDOW, RESULTS_SIZE
+    from app.services.prober import ProbeResult
+    from app.services.metrics import SCHEDULER_LATENESS
+    from app.services.monitor import device_monitor
+
+    # Маршруты вызываются напрямую, без lifespan сервера
+    app = create_app()
+    device_monitor.start()
+
+    report = {"devices": args.devices, "interval": args.interval, "workers": args.workers}
+    try:
+        # Память на устройство: объекты реестра, расписание и заполненные
+        # окна статистики и результатов - как после долгой работы
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        devices = [
+            Device(id=str(uuid.uuid4()), ip=f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+                   name=f"bench-{i}", tags=["bench"])
+            for i in range(args.devices)
+        ]
+        started = time.perf_counter()
+        device_monitor.add_devices(devices)
+        report["import_seconds"] = round(time.perf_counter() - started, 3)
+
+        # Окна заполняются сразу: за время разгона набирается лишь несколько проверок,
+        # а кольцевые буферы дальше не растут
+        filled_at = time.time() - args.interval * max(STATS_WINDOW, RESULTS_SIZE)
+        for device in devices:
+            for index in range(max(STATS_WINDOW, RESULTS_SIZE)):
+                device.stats.add(ProbeResult(True, args.latency, 64, None))
+                device.results.append(filled_at + index * args.interval, 1, args.latency)
+
+        # Разгон: за один интервал каждое устройство проверяется хотя бы раз
+        device_monitor.start_all_monitoring()
+        time.sleep(args.interval + args.timeout)
+        report["memory_per_device_bytes"] = round((tracemalloc.get_traced_memory()[0] - baseline) / args.devices)
+        tracemalloc.stop()
+
+        before = device_monitor.metrics_snapshot()
+        writers = {"status": status_writer.stats(), "history": history.stats()}
+        started = time.monotonic()
+        paths = {path: path.format(id=devices[0].id) for path in API_PATHS}
+        latencies = asyncio.run(api_load(app, paths, args.duration))
+        elapsed = time.monotonic() - started
+        after = device_monitor.metrics_snapshot()
+
+        probes = counter_delta(before["netmon_probes_total"], after["netmon_probes_total"])
+        report["probes_per_second"] = round(probes / elapsed, 1)
+        report["expected_probes_per_second"] = round(args.devices / args.interval, 1)
+
+        count, total, counts = histogram_delta(
+            before["netmon_scheduler_lateness_seconds"], after["netmon_scheduler_lateness_seconds"]
+        )
+        report["drift_ms"] = {
+            "mean": ms(total / count) if count else None,
+            "p50_le": ms(histogram_quantile(SCHEDULER_LATENESS.buckets, counts, 0.5)),
+            "p99_le": ms(histogram_quantile(SCHEDULER_LATENESS.buckets, counts, 0.99)),
+        }
+
+        report["db_rows_per_second"] = {}
+        for name, writer in (("status", status_writer), ("history", history)):
+            rows = writer.stats()["rows"] - writers[name]["rows"]
+            report["db_rows_per_second"][name] = round(rows / elapsed, 1)
+
+        report["api_latency_ms"] = {
+            path: {
+                "requests": len(values),
+                "p50": ms(percentile(values, 50)),
+                "p99": ms(percentile(values, 99)),
+            }
+            for path, values in latencies.items()
+        }
+    finally:
+        device_monitor.shutdown()
+        status_writer.close()
+        history.close()
+        db.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
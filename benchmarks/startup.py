@@ -0,0 +1,141 @@
+"""Замер времени запуска приложения.
+
+Каждый замер выполняется в отдельном процессе интерпретатора: импорт
+пакета app, создание приложения фабрикой и запуск lifespan (схема БД,
+загрузка реестра устройств). Отдельно проверяется одновременный старт
+нескольких процессов на пустой БД - схему должен создать ровно один.
+
+    python -m benchmarks.startup --devices 10000 --repeat 5
+    python -m benchmarks.startup --processes 8 --json startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Код дочернего процесса: печатает длительности этапов в JSON
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+
+async def run_lifespan():
+    async with application.router.lifespan_context(application):
+        return time.perf_counter()
+
+ready = asyncio.run(run_lifespan())
+from app.services.monitor import device_monitor
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "lifespan": ready - created,
+    "devices": len(device_monitor.devices),
+}))
+"""
+
+# Заполнение БД устройствами перед замерами
+POPULATE = """
+import sys, uuid
+from app.models.device import Device
+count = int(sys.argv[1])
+Device.save_many([
+    Device(id=str(uuid.uuid4()), ip=f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", name=f"bench-{i}")
+    for i in range(count)
+])
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Замер времени запуска приложения")
+    parser.add_argument("--devices", type=int, default=1000, help="число устройств в БД")
+    parser.add_argument("--repeat", type=int, default=5, help="число замеров")
+    parser.add_argument("--processes", type=int, default=4, help="число одновременно стартующих процессов")
+    parser.add_argument("--json", help="сохранить результаты в файл для сравнения версий")
+    return parser.parse_args()
+
+
+def child_env(database):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": "sqlite:///" + database,
+        "PROBER": "simulated",
+        "MONITOR_WORKERS": "0",
+        "AUTO_RESUME": "0",
+        "PYTHONPATH": ROOT,
+    })
+    return env
+
+
+def run_child(database, code=CHILD, args=()):
+    output = subprocess.run(
+        [sys.executable, "-c", code, *args], cwd=ROOT, env=child_env(database),
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output) if code is CHILD else None
+
+
+def concurrent_start(directory, processes):
+    """Одновременный старт процессов на пустой БД; возвращает число успешных и версию схемы"""
+    database = os.path.join(directory, "concurrent.db")
+    children = [
+        subprocess.Popen([sys.executable, "-c", CHILD], cwd=ROOT, env=child_env(database),
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for _ in range(processes)
+    ]
+    succeeded = 0
+    for child in children:
+        _, errors = child.communicate()
+        if child.returncode == 0:
+            succeeded += 1
+        else:
+            print(errors, file=sys.stderr)
+    version = subprocess.run(
+        [sys.executable, "-c", "import sqlite3, sys; "
+         "print(sqlite3.connect(sys.argv[1]).execute('PRAGMA user_version').fetchone()[0])", database],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    return succeeded, int(version)
+
+
+def ms(values):
+    return {
+        "median": round(statistics.median(values) * 1000, 1),
+        "min": round(min(values) * 1000, 1),
+    }
+
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp(prefix="netmon-startup-")
+    try:
+        database = os.path.join(directory, "startup.db")
+        run_child(database, POPULATE, (str(args.devices),))
+        samples = [run_child(database) for _ in range(args.repeat)]
+        report = {"devices": args.devices, "repeat": args.repeat}
+        for stage in ("import", "create_app", "lifespan"):
+            report[f"{stage}_ms"] = ms([sample[stage] for sample in samples])
+        report["total_ms"] = ms([sample["import"] + sample["create_app"] + sample["lifespan"] for sample in samples])
+        report["loaded_devices"] = samples[-1]["devices"]
+
+        succeeded, version = concurrent_start(directory, args.processes)
+        report["concurrent_start"] = {"processes": args.processes, "succeeded": succeeded, "schema_version": version}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
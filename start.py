@@ -1,8 +1,9 @@
 import uvicorn
 import os
-from app import app
 
 if __name__ == "__main__":
     print("Запуск API Network Monitor...")
     print("Сервер доступен по адресу: http://localhost:8001")
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    # Приложение создается фабрикой; так же можно запустить
+    # uvicorn app:create_app --factory
+    uvicorn.run("app:create_app", factory=True, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,120 @@
+import asyncio
+import struct
+
+import pytest
+
+from app.services.prober import (
+    IcmpProber, ICMP_ECHO_REPLY, ERROR_RESOLVE, ERROR_TIMEOUT, _checksum,
+)
+
+# Тесты с настоящим сокетом требуют непривилегированного ICMP
+# (net.ipv4.ping_group_range) или прав на raw-сокет
+requires_icmp = pytest.mark.skipif(not IcmpProber.is_available(), reason="ICMP-сокет недоступен")
+
+LOOPBACK = "127.0.0.1"
+
+
+def run(coro_factory):
+    """Выполняет проверку в отдельном цикле событий и закрывает ICMP-сокет"""
+    prober = IcmpProber()
+
+    async def main():
+        try:
+            return await coro_factory(prober)
+        finally:
+            prober.close()
+
+    return asyncio.run(main()), prober
+
+
+def echo_reply(identifier, seq, ttl=64, with_ip_header=False):
+    payload = b"\x00" * 32
+    header = struct.pack("!BBHHH", ICMP_ECHO_REPLY, 0, 0, identifier, seq)
+    header = struct.pack("!BBHHH", ICMP_ECHO_REPLY, 0, _checksum(header + payload), identifier, seq)
+    packet = header + payload
+    if with_ip_header:
+        # Минимальный IPv4-заголовок (IHL=5) с TTL, как его отдает raw-сокет
+        packet = bytes([0x45, 0, 0, 0, 0, 0, 0, 0, ttl]) + b"\x00" * 11 + packet
+    return packet
+
+
+@requires_icmp
+def test_loopback_echo():
+    result, prober = run(lambda prober: prober.ping(LOOPBACK, 1))
+    assert result.ok
+    assert result.error is None
+    assert result.rtt is not None and result.rtt >= 0
+    assert not prober._pending
+
+
+@requires_icmp
+def test_concurrent_pings_share_socket():
+    async def ping_many(prober):
+        return await asyncio.gather(*(prober.ping(LOOPBACK, 1) for _ in range(20)))
+
+    results, prober = run(ping_many)
+    assert all(result.ok for result in results)
+    assert not prober._pending
+
+
+@requires_icmp
+def test_timeout_when_reply_is_lost(monkeypatch):
+    # Ответы loopback приходят всегда, поэтому их потерю имитирует обработчик
+    monkeypatch.setattr(IcmpProber, "_handle_packet", lambda *args: None)
+    result, prober = run(lambda prober: prober.ping(LOOPBACK, 0.2))
+    assert not result.ok
+    assert result.error == ERROR_TIMEOUT
+    assert not prober._pending
+
+
+@requires_icmp
+def test_resolve_failure():
+    result, _ = run(lambda prober: prober.ping("no-such-host.invalid", 1))
+    assert not result.ok
+    assert result.error == ERROR_RESOLVE
+
+
+@pytest.mark.parametrize("is_raw", [False, True])
+def test_reply_matched_by_sequence(is_raw):
+    async def main():
+        loop = asyncio.get_running_loop()
+        prober = IcmpProber()
+        prober._is_raw = is_raw
+        first, second = loop.create_future(), loop.create_future()
+        prober._pending[1] = (LOOPBACK, 0.0, first)
+        prober._pending[2] = (LOOPBACK, 0.0, second)
+
+        prober._handle_packet(echo_reply(prober.identifier, 2, with_ip_header=is_raw), LOOPBACK, 64, 0.005)
+        # Ответ на неизвестный номер игнорируется
+        prober._handle_packet(echo_reply(prober.identifier, 3, with_ip_header=is_raw), LOOPBACK, 64, 0.005)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert not first.done()
+    assert second.result().ok
+    assert second.result().rtt == 5.0
+    assert second.result().ttl == 64
+
+
+def test_raw_reply_with_foreign_identifier_ignored():
+    async def main():
+        prober = IcmpProber()
+        prober._is_raw = True
+        future = asyncio.get_running_loop().create_future()
+        prober._pending[1] = (LOOPBACK, 0.0, future)
+        # Эхо-ответ другому процессу, получившему тот же номер
+        prober._handle_packet(echo_reply(prober.identifier ^ 0xFFFF, 1, with_ip_header=True), LOOPBACK, None, 0.001)
+        return future
+
+    assert not asyncio.run(main()).done()
+
+
+def test_reply_from_other_address_ignored():
+    async def main():
+        prober = IcmpProber()
+        future = asyncio.get_running_loop().create_future()
+        prober._pending[1] = ("192.0.2.1", 0.0, future)
+        prober._handle_packet(echo_reply(prober.identifier, 1), LOOPBACK, 64, 0.001)
+        return future
+
+    assert not asyncio.run(main()).done()